@@ -0,0 +1,215 @@
+import asyncio
+import bisect
+import itertools
+import math
+import time
+
+from starlette.responses import JSONResponse
+
+
+class Shed(Exception):
+    """A request was turned away to protect more important work."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class RoutePolicy:
+    """
+    Admission limits for one route.
+
+    Args:
+        priority: Lower numbers are more important and are admitted first;
+            higher numbers are shed first.
+        max_concurrent: Maximum requests of this route running at once.
+        max_wait: Maximum seconds a request may wait in the queue.
+    """
+
+    def __init__(self, priority: int, max_concurrent: int, max_wait: float):
+        self.priority = priority
+        self.max_concurrent = max_concurrent
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self.admitted = 0
+        self.shed = 0
+        # Moving average of how long a request holds its slot.
+        self.service_time = 1.0
+
+
+class _Waiter:
+    def __init__(self, route: str, policy: RoutePolicy, future: asyncio.Future):
+        self.route = route
+        self.policy = policy
+        self.future = future
+
+
+class AdmissionController:
+    """
+    Share a fixed number of slots between routes, queueing the overflow by
+    priority and shedding requests that would miss their deadline.
+
+    All methods must be called from the event loop thread.
+    """
+
+    def __init__(self, policies: dict, total_slots: int, max_queue: int = 100):
+        """
+        Args:
+            policies: RoutePolicy for each path; other paths are not limited.
+            total_slots: Requests allowed to run at once across all routes,
+                normally the size of the worker threadpool.
+            max_queue: Maximum number of requests waiting for a slot.
+        """
+        self.policies = policies
+        self.total_slots = total_slots
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self._queue = []  # sorted (priority, sequence, waiter) tuples
+        self._sequence = itertools.count()
+
+    def _has_capacity(self, policy: RoutePolicy) -> bool:
+        return self.in_flight < self.total_slots and policy.in_flight < policy.max_concurrent
+
+    def _admit(self, policy: RoutePolicy):
+        self.in_flight += 1
+        policy.in_flight += 1
+        policy.admitted += 1
+
+    def _shed(self, policy: RoutePolicy, reason: str, retry_after: float) -> Shed:
+        policy.shed += 1
+        return Shed(reason, max(1.0, retry_after))
+
+    def _estimated_wait(self, policy: RoutePolicy, ahead: int) -> float:
+        # Requests ahead of this one drain across the route's slots at its
+        # average service time.
+        slots = max(1, min(policy.max_concurrent, self.total_slots))
+        return (ahead // slots + 1) * policy.service_time
+
+    async def acquire(self, route: str):
+        """
+        Wait for a slot for ``route``.
+
+        Raises:
+            Shed: If the request is turned away.
+        """
+        policy = self.policies[route]
+        # Waiters are dispatched as soon as slots free up, so anything still
+        # queued is blocked by its own route limit and need not go first.
+        if self._has_capacity(policy):
+            self._admit(policy)
+            return
+
+        ahead = sum(1 for priority, _, _ in self._queue if priority <= policy.priority)
+        estimated_wait = self._estimated_wait(policy, ahead)
+        if estimated_wait > policy.max_wait:
+            raise self._shed(policy, "deadline", estimated_wait)
+
+        if len(self._queue) >= self.max_queue:
+            # Make room by shedding the least important waiter, unless the
+            # newcomer is the least important.
+            priority, _, victim = self._queue[-1]
+            if priority <= policy.priority:
+                raise self._shed(policy, "queue_full", estimated_wait)
+            self._queue.pop()
+            victim.future.set_exception(
+                self._shed(victim.policy, "preempted", victim.policy.service_time)
+            )
+
+        waiter = _Waiter(route, policy, asyncio.get_running_loop().create_future())
+        entry = (policy.priority, next(self._sequence), waiter)
+        bisect.insort(self._queue, entry, key=lambda e: e[:2])
+        self._dispatch()
+
+        def admitted():
+            return waiter.future.done() and waiter.future.exception() is None
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), policy.max_wait)
+        except asyncio.TimeoutError:
+            if admitted():
+                return
+            if entry in self._queue:
+                self._queue.remove(entry)
+            raise self._shed(policy, "deadline", policy.service_time)
+        except asyncio.CancelledError:
+            # The client went away while queued or just after admission.
+            if admitted():
+                self.release(route)
+            elif entry in self._queue:
+                self._queue.remove(entry)
+            raise
+
+    def release(self, route: str, held_for: float = None):
+        """Free the slot held by a request of ``route`` for ``held_for`` seconds."""
+        policy = self.policies[route]
+        self.in_flight -= 1
+        policy.in_flight -= 1
+        if held_for is not None:
+            policy.service_time = 0.8 * policy.service_time + 0.2 * held_for
+        self._dispatch()
+
+    def _dispatch(self):
+        for entry in list(self._queue):
+            if self.in_flight >= self.total_slots:
+                return
+            waiter = entry[2]
+            if waiter.future.done():
+                self._queue.remove(entry)
+            elif self._has_capacity(waiter.policy):
+                self._queue.remove(entry)
+                self._admit(waiter.policy)
+                waiter.future.set_result(None)
+
+    def stats(self):
+        return {
+            "in_flight": self.in_flight,
+            "queue_depth": len(self._queue),
+            "routes": {
+                route: {
+                    "in_flight": policy.in_flight,
+                    "queued": sum(1 for _, _, w in self._queue if w.route == route),
+                    "admitted": policy.admitted,
+                    "shed": policy.shed,
+                    "service_time_ms": round(policy.service_time * 1000, 1),
+                }
+                for route, policy in self.policies.items()
+            },
+        }
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware that runs every request for a limited route through an
+    AdmissionController before it reaches the worker threadpool.
+
+    Shed requests get an immediate 503 with a Retry-After header.
+    """
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        route = scope.get("path")
+        if scope["type"] != "http" or route not in self.controller.policies:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self.controller.acquire(route)
+        except Shed as shed:
+            retry_after = str(math.ceil(shed.retry_after))
+            response = JSONResponse(
+                {"detail": f"Server busy ({shed.reason}); retry after {retry_after}s."},
+                status_code=503,
+                headers={"Retry-After": retry_after},
+            )
+            await response(scope, receive, send)
+            return
+
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(route, time.monotonic() - started)
@@ -0,0 +1,251 @@
+import argparse
+import re
+import threading
+import time
+
+from database import DatabaseManager
+
+# Age bands are finer for children, whose needs change quickly.
+AGE_BANDS = [(0, 4), (5, 12), (13, 17), (18, 29), (30, 39), (40, 49), (50, 59), (60, 69)]
+
+# Standard BMI categories.
+BMI_BANDS = [(18.5, "underweight"), (25.0, "normal"), (30.0, "overweight")]
+
+ACTIVITY_LEVELS = [
+    ("sedentary", ["sedentary", "none", "no exercise", "inactive"]),
+    ("light", ["light", "1-2", "occasional"]),
+    ("moderate", ["moderate", "3-4", "regular"]),
+    ("active", ["active", "daily", "5", "intense", "athlete"]),
+]
+
+NO_PREFERENCES = {"", "none", "no specific preferences", "no preferences"}
+
+
+def age_band(age) -> str:
+    try:
+        age = int(age)
+    except (TypeError, ValueError):
+        return "unknown"
+    for low, high in AGE_BANDS:
+        if low <= age <= high:
+            return f"{low}-{high}"
+    return "70+"
+
+
+def bmi_band(height, weight) -> str:
+    try:
+        bmi = float(weight) / (float(height) / 100) ** 2
+    except (TypeError, ValueError, ZeroDivisionError):
+        return "unknown"
+    for upper, label in BMI_BANDS:
+        if bmi < upper:
+            return label
+    return "obese"
+
+
+def activity_level(physical_activity) -> str:
+    text = str(physical_activity or "").lower()
+    for level, keywords in ACTIVITY_LEVELS:
+        if any(keyword in text for keyword in keywords):
+            return level
+    return "unknown"
+
+
+def preference_tags(preferences) -> list:
+    tags = {
+        tag.strip(" .")
+        for tag in re.split(r",|;|\band\b", str(preferences or "").lower())
+    }
+    return sorted(tag for tag in tags if tag not in NO_PREFERENCES)
+
+
+def cohort_key(user_info: dict) -> str:
+    """
+    Bucket a user profile into a canonical cohort key.
+
+    Users with the same age band, BMI band, activity level, comorbidities
+    and preference tags share a key and are scored as equivalent.
+    """
+    comorbidities = sorted({str(c).strip().lower() for c in user_info.get("comorbidities") or []})
+    return "|".join(
+        [
+            f"age={age_band(user_info.get('age'))}",
+            f"bmi={bmi_band(user_info.get('height'), user_info.get('weight'))}",
+            f"activity={activity_level(user_info.get('physical_activity'))}",
+            f"comorbidities={','.join(comorbidities)}",
+            f"preferences={','.join(preference_tags(user_info.get('preferences')))}",
+        ]
+    )
+
+
+class CohortScoreCache:
+    """Cache LLM scores per (cohort, UPC) in the ScoreCache table."""
+
+    def __init__(self, db_manager: DatabaseManager):
+        self.db_manager = db_manager
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _keys(user_info, upc):
+        return f"cohort:{cohort_key(user_info)}", f"upc:{upc}"
+
+    def lookup(self, user_info: dict, upc: str):
+        """
+        Return the cached score for this user's cohort and UPC.
+
+        Returns:
+            A dictionary with "score" and "reasoning" or None on a miss.
+        """
+        cached = self.db_manager.get_cached_score(*self._keys(user_info, upc))
+        with self._lock:
+            if cached:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return cached
+
+    def store(self, user_info: dict, upc: str, score: int, reasoning: str):
+        """Cache a score for this user's cohort and UPC."""
+        self.db_manager.cache_score(*self._keys(user_info, upc), score, reasoning)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+def largest_cohorts(users: list, limit: int = 10):
+    """
+    Group users by cohort.
+
+    Returns:
+        A list of (cohort_key, members) tuples, largest cohort first.
+    """
+    cohorts = {}
+    for user in users:
+        cohorts.setdefault(cohort_key(user), []).append(user)
+    return sorted(cohorts.items(), key=lambda item: len(item[1]), reverse=True)[:limit]
+
+
+def precompute(
+    db_manager: DatabaseManager,
+    score_batch,
+    get_food_info,
+    top_upcs: int = 50,
+    top_cohorts: int = 10,
+    batch_size: int = 8,
+):
+    """
+    Score the most-scanned UPCs for the largest cohorts ahead of time.
+
+    Each cohort is scored through one of its members, since every member is
+    treated as equivalent.
+
+    Args:
+        db_manager: Database holding users, history and the score cache.
+        score_batch: Function taking a list of (user_info, food_info) pairs
+            and returning one result per pair (see llm_stuff.get_llm_responses).
+        get_food_info: Function returning food information for a UPC.
+        top_upcs: Number of most-scanned UPCs to score.
+        top_cohorts: Number of largest cohorts to score them for.
+        batch_size: Number of items per model call.
+
+    Returns:
+        A dictionary with the number of items scored, already cached or
+        skipped, and the time spent in the model.
+    """
+    cache = CohortScoreCache(db_manager)
+    upcs = [upc for upc, _ in db_manager.get_upc_scan_counts(top_upcs)]
+    food_by_upc = {}
+    for upc in upcs:
+        try:
+            food_by_upc[upc] = get_food_info(upc)
+        except Exception as e:
+            print(f"Error fetching food info for UPC {upc}: {e}")
+            food_by_upc[upc] = None
+
+    stats = {"scored": 0, "already_cached": 0, "skipped": 0, "model_calls": 0, "model_seconds": 0.0}
+    for _, members in largest_cohorts(db_manager.get_users(), top_cohorts):
+        representative = members[0]
+        todo = []
+        for upc in upcs:
+            if not food_by_upc[upc]:
+                stats["skipped"] += 1
+            elif db_manager.get_cached_score(*cache._keys(representative, upc)):
+                stats["already_cached"] += 1
+            else:
+                todo.append(upc)
+
+        for start in range(0, len(todo), batch_size):
+            chunk = todo[start : start + batch_size]
+            started = time.monotonic()
+            results = score_batch([(representative, food_by_upc[upc]) for upc in chunk])
+            stats["model_seconds"] += time.monotonic() - started
+            stats["model_calls"] += 1
+            for upc, result in zip(chunk, results):
+                cache.store(representative, upc, result.score, result.reasoning)
+                stats["scored"] += 1
+    return stats
+
+
+def savings_report(db_manager: DatabaseManager, seconds_per_call: float = None):
+    """
+    Replay the scan log in History and count the LLM calls a cohort cache
+    saves over a per-user cache.
+
+    Args:
+        db_manager: Database holding the scan log.
+        seconds_per_call: (Optional) Measured model latency, used to express
+            the saving in seconds.
+
+    Returns:
+        A dictionary with the number of scans, the model calls needed with
+        each cache, and the estimated time saved.
+    """
+    users = {}
+    seen_user_keys = set()
+    seen_cohort_keys = set()
+
+    entries = db_manager.get_all_history()
+    for entry in entries:
+        email = entry["email"]
+        if email not in users:
+            users[email] = cohort_key(db_manager.get_user(email) or {})
+        seen_user_keys.add((email, entry["upc"]))
+        seen_cohort_keys.add((users[email], entry["upc"]))
+
+    report = {
+        "scans": len(entries),
+        "cohorts": len(set(users.values())),
+        "per_user_calls": len(seen_user_keys),
+        "cohort_calls": len(seen_cohort_keys),
+        "calls_saved": len(seen_user_keys) - len(seen_cohort_keys),
+    }
+    if seconds_per_call is not None:
+        report["seconds_saved"] = report["calls_saved"] * seconds_per_call
+    return report
+
+
+# Example usage: precompute scores, then report the saving on the scan log.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute cohort scores.")
+    parser.add_argument("--db", default="example.db")
+    parser.add_argument("--top-upcs", type=int, default=50)
+    parser.add_argument("--top-cohorts", type=int, default=10)
+    args = parser.parse_args()
+
+    from llm_stuff import get_llm_responses
+    from open_food_api import get_product_info
+
+    db_manager = DatabaseManager(args.db)
+    stats = precompute(db_manager, get_llm_responses, get_product_info, args.top_upcs, args.top_cohorts)
+    print(stats)
+    seconds_per_call = stats["model_seconds"] / stats["model_calls"] if stats["model_calls"] else None
+    print(savings_report(db_manager, seconds_per_call))
+    db_manager.close()
@@ -1,22 +1,110 @@
 import sqlite3
+import hashlib
+import heapq
+import glob
 import json
+import os
+import re
+import threading
+from collections import Counter
 from datetime import datetime
+from operator import itemgetter
+
+from gtin import canonicalize
 
 
 class DatabaseManager:
-    def __init__(self, db_file="database.db"):
-        """Initialize the manager and run migrations to create the required tables."""
+    def __init__(self, db_file="database.db", shards: int = None, check_layout: bool = True):
+        """
+        Initialize the manager and run migrations to create the required tables.
+
+        Args:
+            db_file: Path of the primary database file.
+            shards: (Optional) Number of database files to partition users
+                and their history across, by a hash of the email. Defaults
+                to the DB_SHARDS environment variable, or a single file.
+            check_layout: Refuse to open the database if users or history
+                are stored under a different shard count. Only reshard.py,
+                which opens both layouts, turns this off.
+
+        Raises:
+            RuntimeError: If check_layout is set and another shard layout
+                of db_file has data.
+        """
         self.db_file = db_file
+        self.shard_count = shards or int(os.getenv("DB_SHARDS", "1"))
+        # The primary connection holds the tables shared by all users, and
+        # everything else when there is only one shard.
+        self.conn = self._connect(self.db_file)
+        if self.shard_count == 1:
+            self.shards = [self.conn]
+        else:
+            self.shards = [
+                self._connect(shard_file(self.db_file, index, self.shard_count))
+                for index in range(self.shard_count)
+            ]
+        # Each database file has its own write lock, so writes to different
+        # shards commit in parallel.
+        self._write_locks = {conn: threading.Lock() for conn in [self.conn, *self.shards]}
+        if check_layout:
+            try:
+                self._check_layout()
+            except RuntimeError:
+                self.close()
+                raise
+
+    def _check_layout(self):
+        # Changing DB_SHARDS does not move any data, so without this check
+        # existing users would silently appear to have no profile or history.
+        stale = {}
+        if self.shard_count > 1 and _has_user_data(self.conn):
+            stale[1] = self.db_file
+        root, ext = os.path.splitext(self.db_file)
+        for path in glob.glob(f"{glob.escape(root)}.shard*-of-*{ext}"):
+            match = re.search(r"\.shard\d+-of-(\d+)" + re.escape(ext) + "$", path)
+            if not match or int(match.group(1)) == self.shard_count:
+                continue
+            conn = sqlite3.connect(path)
+            try:
+                if _has_user_data(conn):
+                    stale[int(match.group(1))] = path
+            finally:
+                conn.close()
+        if stale:
+            count, path = sorted(stale.items())[0]
+            raise RuntimeError(
+                f"{path} holds users or history for a {count}-shard layout, but {self.db_file} is "
+                f"being opened with {self.shard_count}. Move the data with "
+                f"`python reshard.py move --db {self.db_file} --from {count} --to {self.shard_count}` "
+                f"or set DB_SHARDS={count}."
+            )
+
+    def _connect(self, db_file: str):
         # Create a connection and enable row_factory to return dict-like rows.
-        self.conn = sqlite3.connect(self.db_file, check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row
+        conn = sqlite3.connect(db_file, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
         # Enable foreign keys support.
-        self.conn.execute("PRAGMA foreign_keys = ON")
-        self._run_migrations()
+        conn.execute("PRAGMA foreign_keys = ON")
+        # New files use incremental auto-vacuum, so space freed by archiving
+        # old history can be reclaimed without a full VACUUM. Existing files
+        # are converted by enable_incremental_vacuum.
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        self._run_migrations(conn)
+        return conn
+
+    def shard_index(self, email: str) -> int:
+        """Return the index of the shard holding a user and their history."""
+        if self.shard_count == 1:
+            return 0
+        digest = hashlib.blake2b(email.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "big") % self.shard_count
 
-    def _run_migrations(self):
+    def _shard(self, email: str):
+        return self.shards[self.shard_index(email)]
+
+    def _run_migrations(self, conn):
         """Create tables if they do not exist."""
-        cursor = self.conn.cursor()
+        cursor = conn.cursor()
         # Create the Users table.
         cursor.execute(
             """
@@ -61,8 +149,183 @@ class DatabaseManager:
                 ADD COLUMN product_name TEXT;
                 """
             )
-            
-        self.conn.commit()
+
+        # Add ingredients_text column if it doesn't exist
+        if "ingredients_text" not in columns:
+            cursor.execute(
+                """
+                ALTER TABLE History
+                ADD COLUMN ingredients_text TEXT;
+                """
+            )
+
+        # Create the HistoryFTS full-text index over History, kept in sync by
+        # triggers. The email column indexes one token per user, 'u' followed
+        # by the hex of the address, so a search only reads the doclist of
+        # that user's rows. Those tokens are not what History holds, so the
+        # index must never be rebuilt from the content table; it is filled by
+        # INSERT instead.
+        cursor.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'HistoryFTS';"
+        )
+        fts_table = cursor.fetchone()
+        if fts_table is not None and "prefix" not in fts_table[0]:
+            # Earlier indexes split the email into ordinary words.
+            cursor.executescript(
+                """
+                DROP TRIGGER IF EXISTS history_fts_insert;
+                DROP TRIGGER IF EXISTS history_fts_delete;
+                DROP TRIGGER IF EXISTS history_fts_update;
+                DROP TABLE HistoryFTS;
+                """
+            )
+            fts_table = None
+        cursor.execute(
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS HistoryFTS USING fts5(
+                email,
+                product_name,
+                reasoning,
+                ingredients_text,
+                content = 'History',
+                content_rowid = 'id',
+                tokenize = 'porter unicode61',
+                prefix = '2 3'
+            );
+            """
+        )
+        cursor.executescript(
+            """
+            CREATE TRIGGER IF NOT EXISTS history_fts_insert AFTER INSERT ON History BEGIN
+                INSERT INTO HistoryFTS (rowid, email, product_name, reasoning, ingredients_text)
+                VALUES (new.id, 'u' || hex(new.email), new.product_name, new.reasoning, new.ingredients_text);
+            END;
+            CREATE TRIGGER IF NOT EXISTS history_fts_delete AFTER DELETE ON History BEGIN
+                INSERT INTO HistoryFTS (HistoryFTS, rowid, email, product_name, reasoning, ingredients_text)
+                VALUES ('delete', old.id, 'u' || hex(old.email), old.product_name, old.reasoning, old.ingredients_text);
+            END;
+            CREATE TRIGGER IF NOT EXISTS history_fts_update
+            AFTER UPDATE OF email, product_name, reasoning, ingredients_text ON History BEGIN
+                INSERT INTO HistoryFTS (HistoryFTS, rowid, email, product_name, reasoning, ingredients_text)
+                VALUES ('delete', old.id, 'u' || hex(old.email), old.product_name, old.reasoning, old.ingredients_text);
+                INSERT INTO HistoryFTS (rowid, email, product_name, reasoning, ingredients_text)
+                VALUES (new.id, 'u' || hex(new.email), new.product_name, new.reasoning, new.ingredients_text);
+            END;
+            """
+        )
+        # Backfill the index from existing rows the first time it is created.
+        if fts_table is None:
+            cursor.execute(
+                """
+                INSERT INTO HistoryFTS (rowid, email, product_name, reasoning, ingredients_text)
+                SELECT id, 'u' || hex(email), product_name, reasoning, ingredients_text FROM History;
+                """
+            )
+
+        # Add per-user content versions. profile_version changes whenever the
+        # profile is edited and history_version whenever any of the user's
+        # history rows are added, changed or removed; together they identify
+        # the user's current data without reading it.
+        cursor.execute("PRAGMA table_info(Users)")
+        user_columns = [column[1] for column in cursor.fetchall()]
+        for column in ["profile_version", "history_version"]:
+            if column not in user_columns:
+                cursor.execute(
+                    f"""
+                    ALTER TABLE Users
+                    ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0;
+                    """
+                )
+        cursor.executescript(
+            """
+            CREATE TRIGGER IF NOT EXISTS users_profile_version
+            AFTER UPDATE OF height, weight, age, physical_activity, gender, comorbidities, preferences
+            ON Users BEGIN
+                UPDATE Users SET profile_version = profile_version + 1 WHERE email = new.email;
+            END;
+            CREATE TRIGGER IF NOT EXISTS history_version_insert AFTER INSERT ON History BEGIN
+                UPDATE Users SET history_version = history_version + 1 WHERE email = new.email;
+            END;
+            CREATE TRIGGER IF NOT EXISTS history_version_delete AFTER DELETE ON History BEGIN
+                UPDATE Users SET history_version = history_version + 1 WHERE email = old.email;
+            END;
+            -- Every column counts, product names included: /get_history
+            -- returns them under this version. Recreated on each start to
+            -- replace an earlier definition that skipped product_name.
+            DROP TRIGGER IF EXISTS history_version_update;
+            CREATE TRIGGER history_version_update AFTER UPDATE ON History BEGIN
+                UPDATE Users SET history_version = history_version + 1
+                WHERE email IN (old.email, new.email);
+            END;
+            """
+        )
+
+        # Create the ScoreCache table, which stores LLM scores keyed on
+        # whatever identifies an equivalent (profile, food) pair.
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS ScoreCache (
+                profile_key TEXT,
+                food_key TEXT,
+                score INTEGER,
+                reasoning TEXT,
+                created_at TEXT,
+                PRIMARY KEY (profile_key, food_key)
+            );
+            """
+        )
+
+        # Create the ExportCursors table, which remembers the last History id
+        # each incremental export consumer has received.
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS ExportCursors (
+                name TEXT PRIMARY KEY,
+                last_id INTEGER,
+                updated_at TEXT
+            );
+            """
+        )
+
+        # Index the columns get_user_history filters and sorts on so the hot
+        # table stays fast as it grows.
+        cursor.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_history_email_date
+            ON History (email, date);
+            """
+        )
+        # Index UPCs so product names can be filled in across every user's
+        # history without a table scan.
+        cursor.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_history_upc
+            ON History (upc);
+            """
+        )
+
+        # Canonicalize UPCs stored before codes were normalized, so old and
+        # new scans of a product share one key. PRAGMA user_version records
+        # that this has run; cohort score cache keys embed the UPC as well.
+        if conn.execute("PRAGMA user_version;").fetchone()[0] < 1:
+            conn.create_function("canonical_gtin", 1, canonicalize, deterministic=True)
+            cursor.execute(
+                """
+                UPDATE History SET upc = canonical_gtin(upc)
+                WHERE upc IS NOT canonical_gtin(upc);
+                """
+            )
+            cursor.execute(
+                """
+                UPDATE OR REPLACE ScoreCache
+                SET food_key = 'upc:' || canonical_gtin(substr(food_key, 5))
+                WHERE food_key LIKE 'upc:%'
+                AND food_key IS NOT 'upc:' || canonical_gtin(substr(food_key, 5));
+                """
+            )
+            cursor.execute("PRAGMA user_version = 1;")
+
+        conn.commit()
 
     def add_user(
         self,
@@ -88,28 +351,29 @@ class DatabaseManager:
             comorbidities: List of comorbidities/diseases.
             preferences: User's preferences.
         """
-        cursor = self.conn.cursor()
+        conn = self._shard(email)
         comorbidities_json = json.dumps(comorbidities)
         try:
-            cursor.execute(
-                """
-                INSERT INTO Users (
-                    email, height, weight, age, physical_activity,
-                    gender, comorbidities, preferences
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?);
-                """,
-                (
-                    email,
-                    height,
-                    weight,
-                    age,
-                    physical_activity,
-                    gender,
-                    comorbidities_json,
-                    preferences,
-                ),
-            )
-            self.conn.commit()
+            with self._write_locks[conn]:
+                conn.execute(
+                    """
+                    INSERT INTO Users (
+                        email, height, weight, age, physical_activity,
+                        gender, comorbidities, preferences
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?);
+                    """,
+                    (
+                        email,
+                        height,
+                        weight,
+                        age,
+                        physical_activity,
+                        gender,
+                        comorbidities_json,
+                        preferences,
+                    ),
+                )
+                conn.commit()
         except sqlite3.IntegrityError as e:
             print("Error: A user with that email might already exist.")
             raise e
@@ -124,7 +388,7 @@ class DatabaseManager:
         Returns:
             A dictionary with the user's information or None if not found.
         """
-        cursor = self.conn.cursor()
+        cursor = self._shard(email).cursor()
         cursor.execute("SELECT * FROM Users WHERE email = ?;", (email,))
         row = cursor.fetchone()
         if row:
@@ -134,16 +398,34 @@ class DatabaseManager:
             return user
         return None
 
+    def get_user_version(self, email: str):
+        """
+        Retrieve a user's content versions.
+
+        Args:
+            email: The user's email address.
+
+        Returns:
+            A (profile_version, history_version) tuple or None if not found.
+        """
+        cursor = self._shard(email).cursor()
+        cursor.execute(
+            "SELECT profile_version, history_version FROM Users WHERE email = ?;",
+            (email,),
+        )
+        row = cursor.fetchone()
+        return (row["profile_version"], row["history_version"]) if row else None
+
     def get_users(self):
         """
-        Retrieve all users from the Users table.
+        Retrieve all users from the Users table of every shard.
 
         Returns:
             A list of dictionaries, each containing user details.
         """
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT * FROM Users;")
-        rows = cursor.fetchall()
+        rows = []
+        for conn in self.shards:
+            rows += conn.execute("SELECT * FROM Users;").fetchall()
         all_users = []
         for row in rows:
             user = dict(row)
@@ -161,31 +443,74 @@ class DatabaseManager:
         image_url: str,
         date: str = None,
         product_name: str = None,
+        ingredients_text: str = None,
     ):
         """
         Add a new history entry to the History table.
 
         Args:
             email: User's email address to associate with this history.
-            upc: A UPC code or identifier.
+            upc: A UPC code or identifier. Valid codes are stored in their
+                canonical GTIN form; others are stored as given.
             score: Score associated with this history entry.
             reasoning: Explanation or reasoning behind the score.
             image_url: URL of the related image.
             date: (Optional) The date of the entry in ISO format.
                   If not provided, the current datetime is used.
             product_name: (Optional) Name of the product.
+            ingredients_text: (Optional) Ingredient list of the product.
         """
         if date is None:
             date = datetime.now().isoformat()
-        cursor = self.conn.cursor()
-        cursor.execute(
-            """
-            INSERT INTO History (email, upc, score, reasoning, image_url, date, product_name)
-            VALUES (?, ?, ?, ?, ?, ?, ?);
-            """,
-            (email, upc, score, reasoning, image_url, date, product_name),
-        )
-        self.conn.commit()
+        upc = canonicalize(upc)
+        index = self.shard_index(email)
+        conn = self.shards[index]
+        if self.shard_count == 1:
+            new_id, id_params = "NULL", ()
+        else:
+            # Keep ids unique across shards: each shard hands out only ids
+            # congruent to its index modulo the shard count, above the
+            # highest id it has used or been given by resharding.
+            new_id = """(
+                SELECT seq + 1 + ((? - seq - 1) % ? + ?) % ? FROM (
+                    SELECT COALESCE(
+                        (SELECT seq FROM sqlite_sequence WHERE name = 'History'), 0
+                    ) AS seq
+                )
+            )"""
+            id_params = (index, self.shard_count, self.shard_count, self.shard_count)
+        with self._write_locks[conn]:
+            conn.execute(
+                f"""
+                INSERT INTO History (
+                    id, email, upc, score, reasoning, image_url, date, product_name, ingredients_text
+                ) VALUES ({new_id}, ?, ?, ?, ?, ?, ?, ?, ?);
+                """,
+                (*id_params, email, upc, score, reasoning, image_url, date, product_name, ingredients_text),
+            )
+            conn.commit()
+
+    def set_product_names(self, names: dict):
+        """
+        Fill in product names for history entries that do not have one.
+
+        Entries that already have a real name are left unchanged.
+
+        Args:
+            names: Mapping of UPC to product name.
+        """
+        params = [(name, canonicalize(upc)) for upc, name in names.items()]
+        for conn in self.shards:
+            with self._write_locks[conn]:
+                conn.executemany(
+                    """
+                    UPDATE History SET product_name = ?
+                    WHERE upc = ?
+                    AND (product_name IS NULL OR TRIM(product_name) IN ('', 'Unknown Product'));
+                    """,
+                    params,
+                )
+                conn.commit()
 
     def get_user_history(self, email: str):
         """
@@ -197,7 +522,7 @@ class DatabaseManager:
         Returns:
             A list of dictionaries containing history entries.
         """
-        cursor = self.conn.cursor()
+        cursor = self._shard(email).cursor()
         cursor.execute(
             """
             SELECT * FROM History
@@ -209,6 +534,356 @@ class DatabaseManager:
         rows = cursor.fetchall()
         return [dict(row) for row in rows]
 
+    def search_history(self, email: str, query: str, limit: int = 20, offset: int = 0):
+        """
+        Full-text search a user's history by product name, reasoning and
+        ingredients.
+
+        Every word in the query must match; the last word also matches as a
+        prefix so partially typed queries work, once it is at least two
+        characters long. Product name matches rank above ingredient matches,
+        which rank above reasoning matches.
+
+        Args:
+            email: The user's email address.
+            query: Free-text search query.
+            limit: Maximum number of entries to return.
+            offset: Number of entries to skip, for pagination.
+
+        Returns:
+            A list of dictionaries containing history entries, best match first.
+        """
+        terms = _fts_terms(query)
+        if not terms or not email:
+            return []
+        # A one-character prefix is not indexed and would read the doclists
+        # of a large part of the vocabulary.
+        if len(terms[-1].strip('"')) > 1:
+            terms[-1] += "*"
+        match = (
+            f"email : {_fts_email_token(email)} AND "
+            f'{{product_name reasoning ingredients_text}} : ({" ".join(terms)})'
+        )
+        # Rank by the columns that hold a match, which highlight() finds from
+        # the matched rows alone; bm25() would first count every row in the
+        # table that contains each word.
+        cursor = self._shard(email).cursor()
+        cursor.execute(
+            """
+            SELECT History.*,
+                -(10 * (instr(highlight(HistoryFTS, 1, char(1), ''), char(1)) > 0)
+                  + 3 * (instr(highlight(HistoryFTS, 3, char(1), ''), char(1)) > 0)
+                  + (instr(highlight(HistoryFTS, 2, char(1), ''), char(1)) > 0)) AS rank
+            FROM HistoryFTS
+            JOIN History ON History.id = HistoryFTS.rowid
+            WHERE HistoryFTS MATCH ? AND History.email = ?
+            ORDER BY rank, History.date DESC
+            LIMIT ? OFFSET ?;
+            """,
+            (match, email, limit, offset),
+        )
+        rows = cursor.fetchall()
+        return [dict(row) for row in rows]
+
+    def get_all_history(self):
+        """
+        Retrieve every history entry for all users.
+
+        Returns:
+            A list of dictionaries containing history entries, oldest first.
+        """
+        per_shard = [
+            [dict(row) for row in conn.execute("SELECT * FROM History ORDER BY date ASC;")]
+            for conn in self.shards
+        ]
+        return list(heapq.merge(*per_shard, key=itemgetter("date")))
+
+    def iter_history(
+        self,
+        start: str = None,
+        end: str = None,
+        since_id=None,
+        join_users: bool = False,
+        batch_size: int = 1000,
+    ):
+        """
+        Stream history entries for all users, one batch at a time.
+
+        See iter_history_by_shard for the arguments.
+
+        Yields:
+            Lists of dictionaries containing history entries.
+        """
+        for _, rows in self.iter_history_by_shard(start, end, since_id, join_users, batch_size):
+            yield rows
+
+    def iter_history_by_shard(
+        self,
+        start: str = None,
+        end: str = None,
+        since_id=None,
+        join_users: bool = False,
+        batch_size: int = 1000,
+    ):
+        """
+        Stream history entries shard by shard, in id order within each shard.
+
+        Each batch is a separate query resuming after the last id seen, so
+        memory use stays constant and no statement is held open between
+        batches. Ids only increase within a shard, so resuming exports
+        should pass the last id seen in each shard.
+
+        Args:
+            start: (Optional) ISO formatted datetime; inclusive lower bound.
+            end: (Optional) ISO formatted datetime; exclusive upper bound.
+            since_id: (Optional) Only return entries with a larger id. Either
+                one id for every shard, or a dictionary of shard index to id.
+            join_users: Whether to add the user's profile fields to each entry.
+            batch_size: Number of rows fetched per query.
+
+        Yields:
+            (shard index, list of history entry dictionaries) tuples.
+        """
+        columns = "History.*"
+        joins = ""
+        if join_users:
+            columns += (
+                ", Users.height, Users.weight, Users.age, Users.physical_activity,"
+                " Users.gender, Users.comorbidities, Users.preferences"
+            )
+            joins = "LEFT JOIN Users ON Users.email = History.email"
+        conditions = ["History.id > ?"]
+        params = []
+        if start is not None:
+            conditions.append("History.date >= ?")
+            params.append(start)
+        if end is not None:
+            conditions.append("History.date < ?")
+            params.append(end)
+
+        for index, conn in enumerate(self.shards):
+            if isinstance(since_id, dict):
+                last_id = since_id.get(index) or 0
+            else:
+                last_id = since_id or 0
+            cursor = conn.cursor()
+            while True:
+                cursor.execute(
+                    f"""
+                    SELECT {columns} FROM History {joins}
+                    WHERE {" AND ".join(conditions)}
+                    ORDER BY History.id
+                    LIMIT ?;
+                    """,
+                    (last_id, *params, batch_size),
+                )
+                rows = [dict(row) for row in cursor.fetchall()]
+                if not rows:
+                    break
+                if join_users:
+                    for row in rows:
+                        row["comorbidities"] = json.loads(row["comorbidities"] or "[]")
+                last_id = rows[-1]["id"]
+                yield index, rows
+
+    def get_export_cursor(self, name: str):
+        """
+        Retrieve the last History ids delivered to an export consumer.
+
+        Each shard keeps its own position, since ids are only ordered within
+        a shard.
+
+        Args:
+            name: Name of the export consumer.
+
+        Returns:
+            A dictionary of shard index to last exported id, or None if the
+            consumer has not exported yet.
+        """
+        positions = {}
+        for index, conn in enumerate(self.shards):
+            row = conn.execute("SELECT last_id FROM ExportCursors WHERE name = ?;", (name,)).fetchone()
+            if row:
+                positions[index] = row["last_id"]
+        return positions or None
+
+    def set_export_cursor(self, name: str, positions: dict):
+        """
+        Record the last History ids delivered to an export consumer.
+
+        Args:
+            name: Name of the export consumer.
+            positions: Dictionary of shard index to last exported id. Shards
+                left out keep their previous position.
+        """
+        for index, last_id in positions.items():
+            conn = self.shards[index]
+            with self._write_locks[conn]:
+                conn.execute(
+                    """
+                    INSERT OR REPLACE INTO ExportCursors (name, last_id, updated_at)
+                    VALUES (?, ?, ?);
+                    """,
+                    (name, last_id, datetime.now().isoformat()),
+                )
+                conn.commit()
+
+    def get_upc_scan_counts(self, limit: int = 50):
+        """
+        Retrieve the most-scanned UPCs.
+
+        Args:
+            limit: Maximum number of UPCs to return.
+
+        Returns:
+            A list of (upc, scan_count) tuples, most-scanned first.
+        """
+        if self.shard_count == 1:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                """
+                SELECT upc, COUNT(*) AS scans FROM History
+                GROUP BY upc
+                ORDER BY scans DESC
+                LIMIT ?;
+                """,
+                (limit,),
+            )
+            return [(row["upc"], row["scans"]) for row in cursor.fetchall()]
+
+        # A UPC's scans are spread over every shard, so each shard's counts
+        # are needed in full before the top ones are known.
+        counts = Counter()
+        for conn in self.shards:
+            for row in conn.execute("SELECT upc, COUNT(*) AS scans FROM History GROUP BY upc;"):
+                counts[row["upc"]] += row["scans"]
+        return counts.most_common(limit)
+
+    def get_cached_score(self, profile_key: str, food_key: str):
+        """
+        Retrieve a cached score.
+
+        Args:
+            profile_key: Key identifying the user profile.
+            food_key: Key identifying the food.
+
+        Returns:
+            A dictionary with the cached score and reasoning or None if not found.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            SELECT score, reasoning, created_at FROM ScoreCache
+            WHERE profile_key = ? AND food_key = ?;
+            """,
+            (profile_key, food_key),
+        )
+        row = cursor.fetchone()
+        return dict(row) if row else None
+
+    def cache_score(self, profile_key: str, food_key: str, score: int, reasoning: str):
+        """
+        Store a score in the ScoreCache table, replacing any previous entry.
+
+        Args:
+            profile_key: Key identifying the user profile.
+            food_key: Key identifying the food.
+            score: Score to cache.
+            reasoning: Reasoning to cache.
+        """
+        with self._write_locks[self.conn]:
+            self.conn.execute(
+                """
+                INSERT OR REPLACE INTO ScoreCache (profile_key, food_key, score, reasoning, created_at)
+                VALUES (?, ?, ?, ?, ?);
+                """,
+                (profile_key, food_key, score, reasoning, datetime.now().isoformat()),
+            )
+            self.conn.commit()
+
+    def get_history_older_than(self, cutoff: str, limit: int = 1000):
+        """
+        Retrieve the oldest history entries dated before a cutoff.
+
+        Args:
+            cutoff: ISO formatted datetime; entries strictly older are returned.
+            limit: Maximum number of entries to return.
+
+        Returns:
+            A list of dictionaries containing history entries, oldest first.
+        """
+        per_shard = [
+            [
+                dict(row)
+                for row in conn.execute(
+                    """
+                    SELECT * FROM History
+                    WHERE date < ?
+                    ORDER BY date ASC
+                    LIMIT ?;
+                    """,
+                    (cutoff, limit),
+                )
+            ]
+            for conn in self.shards
+        ]
+        return list(heapq.merge(*per_shard, key=itemgetter("date")))[:limit]
+
+    def delete_history(self, ids: list):
+        """
+        Delete history entries by id.
+
+        Args:
+            ids: List of History ids to delete.
+        """
+        # Ids are unique across shards, so each shard deletes the ones it has.
+        params = [(entry_id,) for entry_id in ids]
+        for conn in self.shards:
+            with self._write_locks[conn]:
+                conn.executemany("DELETE FROM History WHERE id = ?;", params)
+                conn.commit()
+
+    def enable_incremental_vacuum(self):
+        """
+        Convert database files created before incremental auto-vacuum to it.
+
+        The mode only takes effect after a full VACUUM, which rewrites the
+        file and blocks every other writer while it runs, so run this from
+        a maintenance job rather than while serving.
+
+        Returns:
+            The number of database files converted.
+        """
+        converted = 0
+        for conn, lock in self._write_locks.items():
+            if conn.execute("PRAGMA auto_vacuum;").fetchone()[0] == 2:
+                continue
+            with lock:
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+                conn.execute("VACUUM;")
+            converted += 1
+        return converted
+
+    def incremental_vacuum(self, pages: int = None):
+        """
+        Return free pages to the filesystem.
+
+        Args:
+            pages: (Optional) Maximum number of pages to reclaim. If not
+                   provided, every free page is reclaimed.
+
+        Returns:
+            The number of free pages left across the database files.
+        """
+        free_pages = 0
+        for conn in self._write_locks:
+            if pages is None:
+                conn.execute("PRAGMA incremental_vacuum;").fetchall()
+            else:
+                conn.execute(f"PRAGMA incremental_vacuum({int(pages)});").fetchall()
+            free_pages += conn.execute("PRAGMA freelist_count;").fetchone()[0]
+        return free_pages
+
     def clear_database(self):
         """
         Clear all data from the database. This deletes all rows from both
@@ -216,36 +891,67 @@ class DatabaseManager:
 
         Note: This is for debugging purposes only.
         """
-        cursor = self.conn.cursor()
-        # Clear History first due to foreign key dependency on Users.
-        cursor.execute("DELETE FROM History;")
-        cursor.execute("DELETE FROM Users;")
-        self.conn.commit()
+        for conn in self.shards:
+            with self._write_locks[conn]:
+                # Clear History first due to foreign key dependency on Users.
+                conn.execute("DELETE FROM History;")
+                conn.execute("DELETE FROM Users;")
+                conn.commit()
         print("Database cleared of all data.")
 
     def view_database(self):
         """
         Print all data from the database for debugging purposes.
         """
-        cursor = self.conn.cursor()
         print("------ USERS TABLE ------")
-        cursor.execute("SELECT * FROM Users;")
-        users = cursor.fetchall()
+        users = [user for conn in self.shards for user in conn.execute("SELECT * FROM Users;")]
         for user in users:
             # Convert the JSON field so it's easier to inspect.
             user_dict = dict(user)
             user_dict["comorbidities"] = json.loads(user_dict["comorbidities"])
             print(user_dict)
         print("\n------ HISTORY TABLE ------")
-        cursor.execute("SELECT * FROM History;")
-        history = cursor.fetchall()
+        history = [entry for conn in self.shards for entry in conn.execute("SELECT * FROM History;")]
         for entry in history:
             print(dict(entry))
         print("\n")
 
     def close(self):
-        """Close the database connection."""
-        self.conn.close()
+        """Close the database connections."""
+        for conn in self._write_locks:
+            conn.close()
+
+
+def _has_user_data(conn) -> bool:
+    """Return whether a database file has any rows in Users or History."""
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table';")}
+    return any(
+        conn.execute(f"SELECT 1 FROM {table} LIMIT 1;").fetchone() is not None
+        for table in ("Users", "History")
+        if table in tables
+    )
+
+
+def shard_file(db_file: str, index: int, count: int) -> str:
+    """
+    Return the path of one shard of a database split into ``count`` files.
+
+    The shard count is part of the name, so files written for one layout
+    are never opened with another.
+    """
+    root, ext = os.path.splitext(db_file)
+    return f"{root}.shard{index}-of-{count}{ext}"
+
+
+def _fts_email_token(email: str) -> str:
+    """Return the quoted token HistoryFTS indexes as the email of a user's rows."""
+    # Same value as 'u' || hex(email) in SQL; the tokenizer folds the case.
+    return f'"u{email.encode("utf-8").hex()}"'
+
+
+def _fts_terms(text: str):
+    """Split text into quoted FTS5 terms, matching the unicode61 tokenizer."""
+    return [f'"{token}"' for token in re.findall(r"[^\W_]+", text or "")]
 
 
 # Example usage:
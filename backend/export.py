@@ -0,0 +1,187 @@
+import argparse
+import json
+import sys
+
+from database import DatabaseManager
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Arrow and Parquet exports need the optional pyarrow package.
+    pa = None
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def _schema(join_users: bool):
+    fields = [
+        ("id", pa.int64()),
+        ("email", pa.string()),
+        ("upc", pa.string()),
+        ("score", pa.int64()),
+        ("reasoning", pa.string()),
+        ("image_url", pa.string()),
+        ("date", pa.string()),
+        ("product_name", pa.string()),
+        ("ingredients_text", pa.string()),
+    ]
+    if join_users:
+        fields += [
+            ("height", pa.float64()),
+            ("weight", pa.float64()),
+            ("age", pa.int64()),
+            ("physical_activity", pa.string()),
+            ("gender", pa.string()),
+            ("comorbidities", pa.list_(pa.string())),
+            ("preferences", pa.string()),
+        ]
+    return pa.schema(fields)
+
+
+class _ChunkSink:
+    """File-like object that hands written bytes back to a generator."""
+
+    def __init__(self):
+        self.chunks = []
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _arrow_chunks(batches, join_users: bool, fmt: str):
+    schema = _schema(join_users)
+    sink = _ChunkSink()
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(sink, schema)
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+
+    for rows in batches:
+        # Each batch becomes one Parquet row group or Arrow record batch.
+        if fmt == "parquet":
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+        else:
+            writer.write_batch(pa.RecordBatch.from_pylist(rows, schema=schema))
+        data = sink.drain()
+        if data:
+            yield data
+    writer.close()
+    yield sink.drain()
+
+
+def export_history(
+    db_manager: DatabaseManager,
+    fmt: str = "ndjson",
+    start: str = None,
+    end: str = None,
+    since_id: int = None,
+    cursor: str = None,
+    commit_cursor: bool = False,
+    join_users: bool = False,
+    batch_size: int = 1000,
+):
+    """
+    Stream the History table as NDJSON lines or Arrow/Parquet record batches.
+
+    Args:
+        db_manager: Database to export from.
+        fmt: One of "ndjson", "arrow" (IPC stream) or "parquet".
+        start: (Optional) ISO formatted datetime; inclusive lower bound.
+        end: (Optional) ISO formatted datetime; exclusive upper bound.
+        since_id: (Optional) Only export entries with a larger id. Ids only
+            increase within a shard, so on a sharded database this applies
+            to each shard separately; use a cursor to resume reliably.
+        cursor: (Optional) Name of an incremental export consumer. The export
+            resumes after the last id committed for this consumer in each shard.
+        commit_cursor: Whether to advance the cursor past the exported entries
+            once the whole export has been consumed. Reading alone never
+            moves it.
+        join_users: Whether to add each user's profile fields.
+        batch_size: Number of rows per database query and record batch.
+
+    Returns:
+        A generator of encoded output chunks as bytes.
+
+    Raises:
+        ValueError: If the format is unknown or needs pyarrow and it is
+            not installed. Raised before anything is streamed.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    if fmt != "ndjson" and pa is None:
+        raise ValueError(f"The {fmt} format requires the pyarrow package.")
+    if commit_cursor and cursor is None:
+        raise ValueError("commit_cursor requires a cursor name.")
+    if cursor is not None and since_id is None:
+        since_id = db_manager.get_export_cursor(cursor)
+    commit_to = cursor if commit_cursor else None
+    return _stream(db_manager, fmt, start, end, since_id, commit_to, join_users, batch_size)
+
+
+def _stream(db_manager, fmt, start, end, since_id, commit_to, join_users, batch_size):
+    positions = {}
+
+    def batches():
+        for shard, rows in db_manager.iter_history_by_shard(start, end, since_id, join_users, batch_size):
+            positions[shard] = rows[-1]["id"]
+            yield rows
+
+    if fmt == "ndjson":
+        for rows in batches():
+            yield "".join(json.dumps(row) + "\n" for row in rows).encode("utf-8")
+    else:
+        yield from _arrow_chunks(batches(), join_users, fmt)
+
+    if commit_to is not None and positions:
+        db_manager.set_export_cursor(commit_to, positions)
+
+
+# Example usage: python export.py --format parquet --out history.parquet --cursor analytics --commit-cursor
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export scan history.")
+    parser.add_argument("--db", default="example.db")
+    parser.add_argument("--format", choices=list(FORMATS), default="ndjson")
+    parser.add_argument("--out", help="Output file; defaults to stdout.")
+    parser.add_argument("--start", help="Inclusive ISO start date.")
+    parser.add_argument("--end", help="Exclusive ISO end date.")
+    parser.add_argument("--since-id", type=int)
+    parser.add_argument("--cursor", help="Resume from this named cursor.")
+    parser.add_argument("--commit-cursor", action="store_true", help="Advance the cursor once the export is written.")
+    parser.add_argument("--join-users", action="store_true")
+    args = parser.parse_args()
+
+    db_manager = DatabaseManager(args.db)
+    out = open(args.out, "wb") if args.out else sys.stdout.buffer
+    try:
+        for chunk in export_history(
+            db_manager,
+            fmt=args.format,
+            start=args.start,
+            end=args.end,
+            since_id=args.since_id,
+            cursor=args.cursor,
+            commit_cursor=args.commit_cursor,
+            join_users=args.join_users,
+        ):
+            out.write(chunk)
+    finally:
+        if args.out:
+            out.close()
+        db_manager.close()
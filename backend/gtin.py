@@ -0,0 +1,90 @@
+import re
+
+# Characters scanners and users add around a code that are not part of it.
+_SEPARATORS = re.compile(r"[\s-]+")
+
+
+class InvalidGTIN(ValueError):
+    """A product code is not a well-formed GTIN."""
+
+
+def check_digit(body: str) -> str:
+    """
+    Compute the GS1 mod-10 check digit for the digits of a GTIN before its
+    check digit.
+    """
+    total = sum(int(d) * (3 if i % 2 == 0 else 1) for i, d in enumerate(reversed(body)))
+    return str(-total % 10)
+
+
+def is_valid(code: str) -> bool:
+    """Return whether a string of digits ends in the correct check digit."""
+    return len(code) > 1 and code.isdigit() and check_digit(code[:-1]) == code[-1]
+
+
+def expand_upce(code: str) -> str:
+    """
+    Expand an 8-digit UPC-E code to the 12-digit UPC-A it abbreviates.
+
+    Args:
+        code: Number system digit (0 or 1), six data digits and the check digit.
+
+    Returns:
+        The UPC-A code, with the same number system and check digit.
+    """
+    number_system, data, check = code[0], code[1:7], code[7]
+    last = data[5]
+    if last in "012":
+        body = data[:2] + last + "0000" + data[2:5]
+    elif last == "3":
+        body = data[:3] + "00000" + data[3:5]
+    elif last == "4":
+        body = data[:4] + "00000" + data[4]
+    else:
+        body = data[:5] + "0000" + last
+    return number_system + body + check
+
+
+def canonicalize(code: str, strict: bool = False):
+    """
+    Bring a product code to the canonical form used for every key and index.
+
+    UPC-A and UPC-E codes are widened to 13-digit EAN-13, and GTIN-14 codes
+    with a leading zero are trimmed to it. EAN-8 codes stay 8 digits, and
+    GTIN-14 codes for cases or pallets stay 14. Whitespace and hyphens are
+    removed first.
+
+    An 8-digit code starting with 0 is read as UPC-E when its check digit
+    is valid as one, since EAN-8 codes starting with 0 are reserved for
+    in-store use. Other 8-digit codes are read as EAN-8 first.
+
+    Args:
+        code: The code as scanned or stored.
+        strict: Raise on codes that cannot be validated instead of returning
+            them cleaned up as far as possible.
+
+    Returns:
+        The canonical code, or None if code is None.
+
+    Raises:
+        InvalidGTIN: If strict is set and the code is not a valid GTIN.
+    """
+    if code is None:
+        return None
+    digits = _SEPARATORS.sub("", str(code))
+
+    if digits.isdigit():
+        if len(digits) == 8:
+            upce = digits[0] in "01" and is_valid(expand_upce(digits))
+            if upce and (digits[0] == "0" or not is_valid(digits)):
+                return "0" + expand_upce(digits)
+            if is_valid(digits):
+                return digits
+        elif len(digits) in (12, 13, 14) and is_valid(digits):
+            if len(digits) == 14 and digits[0] == "0":
+                return digits[1:]
+            return digits.zfill(13)
+
+    if strict:
+        raise InvalidGTIN(f"{code!r} is not a valid UPC, EAN or GTIN code.")
+    return digits if digits.isdigit() else str(code).strip()
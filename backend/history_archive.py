@@ -0,0 +1,182 @@
+import argparse
+import glob
+import gzip
+import hashlib
+import json
+import os
+import re
+from datetime import datetime, timedelta
+
+from database import DatabaseManager
+
+# Rows older than this many days are moved out of the hot History table.
+DEFAULT_MAX_AGE_DAYS = int(os.getenv("HISTORY_RETENTION_DAYS", "90"))
+DEFAULT_ARCHIVE_DIR = os.getenv("HISTORY_ARCHIVE_DIR", "history_archive")
+# Each month is split into this many partitions by a hash of the email.
+DEFAULT_BUCKETS = int(os.getenv("HISTORY_ARCHIVE_BUCKETS", "64"))
+
+# history-<month>[.b<bucket>-of-<buckets>].ndjson.gz; partitions written
+# before bucketing have no bucket part and hold every user's entries.
+_PARTITION_NAME = re.compile(r"history-(?P<month>[^.]+)(?:\.b(?P<bucket>\d+)-of-(?P<buckets>\d+))?\.ndjson\.gz$")
+
+
+def email_bucket(email: str, buckets: int) -> int:
+    """Return the archive bucket holding a user's entries."""
+    digest = hashlib.blake2b((email or "").encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % buckets
+
+
+class HistoryArchiver:
+    """
+    Move old History rows into monthly gzip compressed NDJSON partitions.
+
+    Each month is split by a hash of the email into ``buckets`` partitions
+    named ``history-YYYY-MM.bNN-of-MM.ndjson.gz``, so reading one user's
+    archive only opens that user's bucket for each month. Archiving appends a new gzip member to the partition
+    and only deletes the rows from the database once the file has been
+    flushed to disk, so an interrupted run can at worst leave duplicates in
+    the archive, which ``query`` skips.
+    """
+
+    def __init__(
+        self,
+        db_manager: DatabaseManager,
+        archive_dir: str = DEFAULT_ARCHIVE_DIR,
+        max_age_days: int = DEFAULT_MAX_AGE_DAYS,
+        batch_size: int = 1000,
+        buckets: int = DEFAULT_BUCKETS,
+    ):
+        self.db_manager = db_manager
+        self.archive_dir = archive_dir
+        self.max_age_days = max_age_days
+        self.batch_size = batch_size
+        self.buckets = buckets
+
+    def _partition_path(self, month: str, email: str):
+        bucket = email_bucket(email, self.buckets)
+        return os.path.join(self.archive_dir, f"history-{month}.b{bucket:02d}-of-{self.buckets}.ndjson.gz")
+
+    @staticmethod
+    def _partition_month(entry):
+        try:
+            return datetime.fromisoformat(entry["date"]).strftime("%Y-%m")
+        except (TypeError, ValueError):
+            return "undated"
+
+    def archive(self, now: datetime = None):
+        """
+        Archive every history entry older than ``max_age_days``.
+
+        Args:
+            now: (Optional) Reference time for the cutoff; defaults to now.
+
+        Returns:
+            A dictionary with the number of archived rows, the partitions
+            written to and the free pages left after vacuuming.
+        """
+        if now is None:
+            now = datetime.now()
+        cutoff = (now - timedelta(days=self.max_age_days)).isoformat()
+        os.makedirs(self.archive_dir, exist_ok=True)
+
+        archived = 0
+        partitions = set()
+        while True:
+            entries = self.db_manager.get_history_older_than(cutoff, self.batch_size)
+            if not entries:
+                break
+
+            by_partition = {}
+            for entry in entries:
+                path = self._partition_path(self._partition_month(entry), entry["email"])
+                by_partition.setdefault(path, []).append(entry)
+
+            for path, partition_entries in by_partition.items():
+                with gzip.open(path, "at", encoding="utf-8") as archive_file:
+                    for entry in partition_entries:
+                        archive_file.write(json.dumps(entry) + "\n")
+                    archive_file.flush()
+                    os.fsync(archive_file.fileno())
+                partitions.add(path)
+
+            self.db_manager.delete_history([entry["id"] for entry in entries])
+            archived += len(entries)
+
+        free_pages = self.db_manager.incremental_vacuum()
+        return {
+            "archived": archived,
+            "partitions": sorted(partitions),
+            "free_pages": free_pages,
+        }
+
+    def partitions(self):
+        """Return the paths of all archive partitions, oldest first."""
+        return sorted(glob.glob(os.path.join(self.archive_dir, "history-*.ndjson.gz")))
+
+    def query(self, email: str = None, start: str = None, end: str = None):
+        """
+        Read archived history entries on demand.
+
+        Only partitions whose month overlaps the requested range are opened,
+        and entries without a date are only read when no start is given.
+        With an email, only that user's bucket of each month is opened.
+
+        Args:
+            email: (Optional) Only return entries for this user.
+            start: (Optional) ISO formatted datetime; inclusive lower bound.
+            end: (Optional) ISO formatted datetime; exclusive upper bound.
+
+        Returns:
+            A list of dictionaries containing history entries, newest first.
+        """
+        results = {}
+        for path in self.partitions():
+            name = _PARTITION_NAME.match(os.path.basename(path))
+            if name is None:
+                continue
+            month = name["month"]
+            if email is not None and name["bucket"] is not None:
+                if int(name["bucket"]) != email_bucket(email, int(name["buckets"])):
+                    continue
+            if month == "undated":
+                if start:
+                    continue
+            else:
+                if start and month < start[:7]:
+                    continue
+                if end and month > end[:7]:
+                    continue
+            with gzip.open(path, "rt", encoding="utf-8") as archive_file:
+                for line in archive_file:
+                    entry = json.loads(line)
+                    if email is not None and entry["email"] != email:
+                        continue
+                    if start and (entry["date"] or "") < start:
+                        continue
+                    if end and (entry["date"] or "") >= end:
+                        continue
+                    results[entry["id"]] = entry
+        return sorted(results.values(), key=lambda e: e["date"] or "", reverse=True)
+
+
+# Example usage: run periodically (e.g. from cron) to keep History small.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive old scan history.")
+    parser.add_argument("--db", default="example.db")
+    parser.add_argument("--archive-dir", default=DEFAULT_ARCHIVE_DIR)
+    parser.add_argument("--max-age-days", type=int, default=DEFAULT_MAX_AGE_DAYS)
+    parser.add_argument(
+        "--enable-incremental-vacuum",
+        action="store_true",
+        help="First convert older database files to incremental auto-vacuum (runs a full VACUUM once).",
+    )
+    args = parser.parse_args()
+
+    db_manager = DatabaseManager(args.db)
+    if args.enable_incremental_vacuum:
+        print(f"Converted {db_manager.enable_incremental_vacuum()} database file(s) to incremental auto-vacuum.")
+    archiver = HistoryArchiver(
+        db_manager, archive_dir=args.archive_dir, max_age_days=args.max_age_days
+    )
+    print(archiver.archive())
+    db_manager.close()
@@ -0,0 +1,53 @@
+from fastapi import Response
+from fastapi.responses import JSONResponse
+
+from database import DatabaseManager
+
+try:
+    import orjson  # noqa: F401
+    from fastapi.responses import ORJSONResponse as FastJSONResponse
+except ImportError:  # orjson is optional; fall back to the standard encoder.
+    FastJSONResponse = JSONResponse
+
+# Clients may keep responses but must revalidate them on every use.
+CACHE_CONTROL = "private, no-cache"
+
+
+def user_etag(db_manager: DatabaseManager, email: str, kind: str):
+    """
+    Build an ETag for one of a user's resources from their content versions.
+
+    Args:
+        db_manager: Database holding the user.
+        email: The user's email address.
+        kind: Short name of the resource, so different resources built from
+            the same data get different tags.
+
+    Returns:
+        A quoted ETag string, or None if the user does not exist.
+    """
+    version = db_manager.get_user_version(email)
+    if version is None:
+        return None
+    profile_version, history_version = version
+    return f'"{kind}-{profile_version}-{history_version}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Return whether an If-None-Match header matches the current ETag."""
+    if not if_none_match or not etag:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+def cached_json(content, etag: str) -> Response:
+    """Serialize content with the fast encoder and tag it for revalidation."""
+    headers = {"Cache-Control": CACHE_CONTROL}
+    if etag:
+        headers["ETag"] = etag
+    return FastJSONResponse(content, headers=headers)
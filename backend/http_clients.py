@@ -0,0 +1,120 @@
+import os
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import requests
+from openfoodfacts.utils import http_session as off_http_session
+from requests.adapters import HTTPAdapter
+
+# Upstream calls are made from FastAPI's worker threads (40 by default) and
+# may be hedged, so each host gets room for twice that many live connections.
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "40"))
+POOL_SIZE = WORKER_CONCURRENCY * 2
+
+try:
+    import h2  # noqa: F401
+
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+LIMITS = httpx.Limits(
+    max_connections=POOL_SIZE,
+    max_keepalive_connections=POOL_SIZE,
+    keepalive_expiry=60,
+)
+
+
+def configure_session(session: requests.Session):
+    """Give a requests session keep-alive pools sized for the worker count."""
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# The openfoodfacts package sends every request through one module-level
+# session; size its pools instead of leaving the default of 10.
+configure_session(off_http_session)
+
+# Shared client for everything else. httpx[http2] pulls in h2, so HTTP/2 is
+# negotiated with hosts that support it; an install without the extra falls
+# back to HTTP/1.1 keep-alive.
+client = httpx.Client(http2=HTTP2_AVAILABLE, limits=LIMITS, follow_redirects=True)
+
+
+class _BenchmarkHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        body = b'{"status": 1, "product": {}}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def benchmark(calls: int = 200):
+    """
+    Measure per-call latency against a local stand-in server, opening a new
+    connection for every call (cold) versus reusing pooled connections (warm).
+
+    Returns:
+        A dictionary of median and p95 latencies in milliseconds per client.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _BenchmarkHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/api/v2/product/0"
+
+    def cold_requests():
+        with requests.Session() as session:
+            session.get(url, timeout=5).json()
+
+    warm_session = configure_session(requests.Session())
+
+    def warm_requests():
+        warm_session.get(url, timeout=5).json()
+
+    def cold_httpx():
+        with httpx.Client() as cold_client:
+            cold_client.get(url, timeout=5).json()
+
+    def warm_httpx():
+        client.get(url, timeout=5).json()
+
+    results = {}
+    for name, fn in [
+        ("requests_cold", cold_requests),
+        ("requests_warm", warm_requests),
+        ("httpx_cold", cold_httpx),
+        ("httpx_warm", warm_httpx),
+    ]:
+        fn()
+        latencies = []
+        for _ in range(calls):
+            started = time.perf_counter()
+            fn()
+            latencies.append((time.perf_counter() - started) * 1000)
+        latencies.sort()
+        results[name] = {
+            "p50_ms": round(statistics.median(latencies), 3),
+            "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 3),
+        }
+
+    server.shutdown()
+    return results
+
+
+# Example usage: compare cold and warm connections. The stand-in server is
+# plain HTTP on loopback, so real hosts save a TLS handshake on top of this.
+if __name__ == "__main__":
+    for name, stats in benchmark().items():
+        print(f"{name:>14}: p50 {stats['p50_ms']:.3f} ms, p95 {stats['p95_ms']:.3f} ms")
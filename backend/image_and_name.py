@@ -1,8 +1,48 @@
 
-import requests
+import os
+
 from bs4 import BeautifulSoup
 
+from gtin import canonicalize
+from http_clients import client
+from upstream import Dependency, TokenBucket
+
+GO_UPC_TIMEOUT = float(os.getenv("GO_UPC_TIMEOUT_S", "5"))
+
+
+class ProductNotFound(Exception):
+    """The page loaded but does not describe a product."""
+
+
+go_upc = Dependency(
+    "go_upc",
+    timeout=GO_UPC_TIMEOUT,
+    hedge_after=float(os.getenv("GO_UPC_HEDGE_AFTER_S", "1.5")),
+    expected_errors=(ProductNotFound,),
+    rate_limiter=TokenBucket.from_env("GO_UPC"),
+)
+
+
 def scrape_image(upc):
+    """
+    Return the Go-UPC product image URL for a UPC.
+    """
+    return scrape_product_details(upc)["image"]
+
+
+def scrape_product_details(upc):
+    """
+    Return the Go-UPC product name and image URL for a UPC.
+
+    The lookup runs through the go_upc dependency: it is bounded by the
+    request deadline, hedged, and answered from the last good result while
+    Go-UPC is unavailable.
+    """
+    upc = canonicalize(upc)
+    return go_upc.call(_scrape_product_details, upc, idempotent=True, cache_key=upc)
+
+
+def _scrape_product_details(upc):
     """
     Given a UPC code, scrape the Go-UPC search results page for the product name
     and product image URL.
@@ -17,8 +57,8 @@ def scrape_image(upc):
     # Construct the URL with the provided UPC
     url = f"https://go-upc.com/search?q={upc}"
 
-    # Fetch the page content
-    response = requests.get(url)
+    # Fetch the page content over the shared keep-alive client
+    response = client.get(url, timeout=GO_UPC_TIMEOUT)
     if response.status_code != 200:
         raise Exception(f"Failed to fetch URL ({url}). Status code: {response.status_code}")
 
@@ -28,7 +68,7 @@ def scrape_image(upc):
     # Locate the product name; it is in a <h1> with class "product-name"
     product_name_tag = soup.find("h1", class_="product-name")
     if not product_name_tag:
-        raise Exception("Could not find the product name on the page.")
+        raise ProductNotFound("Could not find the product name on the page.")
     product_name = product_name_tag.get_text(strip=True)
 
     # Locate the product image; first try the non-mobile version, then mobile
@@ -36,14 +76,14 @@ def scrape_image(upc):
     if not image_figure:
         image_figure = soup.find("figure", class_="product-image mobile")
     if not image_figure:
-        raise Exception("Could not find the product image on the page.")
+        raise ProductNotFound("Could not find the product image on the page.")
 
     image_tag = image_figure.find("img")
     if not image_tag or not image_tag.get("src"):
-        raise Exception("Product image source not found.")
+        raise ProductNotFound("Product image source not found.")
     product_image = image_tag["src"]  # This should be the full image URL
 
-    return product_image
+    return {"name": product_name, "image": product_image}
 
 # Example usage
 if __name__ == "__main__":
@@ -0,0 +1,181 @@
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class _PendingScore:
+    """A single caller waiting for its item of a batch to be scored."""
+
+    def __init__(self, user_info, food_info):
+        self.user_info = user_info
+        self.food_info = food_info
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ScoringBatcher:
+    """
+    Collect concurrent scoring requests and send them to the model together.
+
+    The first request to arrive opens a batch; the batch is dispatched once
+    ``window`` seconds have passed or ``max_batch_size`` requests have joined,
+    whichever comes first. Each caller blocks until its own result is ready.
+    A window of 0 or a batch size of 1 disables batching entirely.
+    """
+
+    def __init__(self, score_batch, window: float = 0.05, max_batch_size: int = 8, max_in_flight: int = 4):
+        """
+        Args:
+            score_batch: Function taking a list of (user_info, food_info)
+                pairs and returning one result per pair, in order.
+            window: Maximum time in seconds to hold a batch open.
+            max_batch_size: Maximum number of items per model call.
+            max_in_flight: Maximum number of batches being scored at once.
+        """
+        self.score_batch = score_batch
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._pending = []
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        self._collector = None
+
+    def score(self, user_info, food_info, timeout: float = None):
+        """
+        Score one item, batched with whatever else arrives in the same window.
+
+        Args:
+            user_info: Dictionary containing user information.
+            food_info: Dictionary containing food information.
+            timeout: (Optional) Seconds to wait for the result.
+
+        Returns:
+            The model's result for this item.
+        """
+        if self.window <= 0 or self.max_batch_size <= 1:
+            return self.score_batch([(user_info, food_info)])[0]
+
+        pending = _PendingScore(user_info, food_info)
+        with self._condition:
+            if self._collector is None:
+                self._collector = threading.Thread(target=self._collect, daemon=True)
+                self._collector.start()
+            self._pending.append(pending)
+            self._condition.notify()
+
+        if not pending.done.wait(timeout):
+            raise TimeoutError("Timed out waiting for the batched LLM response.")
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _collect(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                dispatch_at = time.monotonic() + self.window
+                while len(self._pending) < self.max_batch_size:
+                    remaining = dispatch_at - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                batch = self._pending[: self.max_batch_size]
+                self._pending = self._pending[self.max_batch_size :]
+            self._executor.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch):
+        try:
+            results = self.score_batch([(p.user_info, p.food_info) for p in batch])
+            for pending, result in zip(batch, results):
+                pending.result = result
+        except Exception as e:
+            print(f"ERROR scoring batch of {len(batch)} items: {e}")
+            for pending in batch:
+                pending.error = e
+        finally:
+            for pending in batch:
+                pending.done.set()
+
+
+class FakeScoringModel:
+    """
+    Local stand-in for the scoring model with a fixed per-call overhead and a
+    small per-item cost, used to measure batching trade-offs offline.
+    """
+
+    def __init__(self, call_overhead: float = 0.4, per_item: float = 0.02):
+        self.call_overhead = call_overhead
+        self.per_item = per_item
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def score_batch(self, pairs):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.call_overhead + self.per_item * len(pairs))
+        return [{"score": 50, "reasoning": "fake"} for _ in pairs]
+
+
+def batching_report(configs, requests: int = 200, arrival_rate: float = 100.0, seed: int = 0):
+    """
+    Replay a burst of requests against the fake model for each configuration.
+
+    Args:
+        configs: List of (window_seconds, max_batch_size) tuples.
+        requests: Number of scoring requests per run.
+        arrival_rate: Mean requests per second (Poisson arrivals).
+        seed: Random seed so every configuration sees the same arrivals.
+
+    Returns:
+        A list of dictionaries with the model call count and latency
+        percentiles (in milliseconds) for each configuration.
+    """
+    report = []
+    for window, max_batch_size in configs:
+        rng = random.Random(seed)
+        model = FakeScoringModel()
+        batcher = ScoringBatcher(model.score_batch, window=window, max_batch_size=max_batch_size, max_in_flight=64)
+        latencies = []
+        lock = threading.Lock()
+
+        def caller():
+            started = time.monotonic()
+            batcher.score({}, {})
+            with lock:
+                latencies.append((time.monotonic() - started) * 1000)
+
+        threads = []
+        for _ in range(requests):
+            time.sleep(rng.expovariate(arrival_rate))
+            thread = threading.Thread(target=caller)
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+
+        latencies.sort()
+        report.append(
+            {
+                "window_ms": window * 1000,
+                "max_batch_size": max_batch_size,
+                "model_calls": model.calls,
+                "p50_ms": round(statistics.median(latencies), 1),
+                "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 1),
+            }
+        )
+    return report
+
+
+# Example usage: print the batch-size / latency trade-off against the fake model.
+if __name__ == "__main__":
+    configs = [(0, 1), (0.025, 4), (0.05, 8), (0.1, 16), (0.2, 32)]
+    print(f"{'window_ms':>10} {'max_batch':>10} {'calls':>6} {'p50_ms':>8} {'p95_ms':>8}")
+    for row in batching_report(configs):
+        print(
+            f"{row['window_ms']:>10.0f} {row['max_batch_size']:>10} {row['model_calls']:>6}"
+            f" {row['p50_ms']:>8} {row['p95_ms']:>8}"
+        )
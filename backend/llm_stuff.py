@@ -1,109 +1,86 @@
 from langchain_openai import ChatOpenAI
-from langchain_core.prompts import PromptTemplate
 from dotenv import load_dotenv
 import os
 from pydantic import BaseModel, Field
+from typing import List
 from langchain_google_genai import ChatGoogleGenerativeAI
+from prompts import batch_scoring_messages, invoke_structured, scoring_messages
+from upstream import Dependency, TokenBucket
 load_dotenv()
 print(os.getenv("GEMINI_API_KEY"))
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT_S", "20"))
 model = ChatGoogleGenerativeAI(
     model="gemini-2.0-flash-lite",
     temperature=0,
     max_tokens=None,
-    timeout=None,
-    max_retries=2,
+    timeout=GEMINI_TIMEOUT,
+    # Retries are left to the Dependency, so one call never runs longer
+    # than the timeout it is given there.
+    max_retries=0,
     api_key=os.getenv("GEMINI_API_KEY")
 
 )
 
+# Scoring calls are not hedged: each attempt is billed.
+gemini = Dependency("gemini", timeout=GEMINI_TIMEOUT, rate_limiter=TokenBucket.from_env("GEMINI"))
+
 
 class ResponseFormatter(BaseModel):
     score: int
     reasoning: str
 
-prompt_template = PromptTemplate.from_template(
-    """
-    Below is an enhanced prompt that integrates fields from two distinct sources: the patient's health record and detailed food information. Use this prompt to evaluate how healthy a specific food is for the patient. Each field is defined as follows:
-
-    Patient Information:
-    - Email: The patient's unique email address.
-    - Height: Patient's height in centimeters.
-    - Weight: Patient's weight in kilograms.
-    - Age: Patient's age in years.
-    - Physical Activity Level: Description of the patient's daily movement or exercise habits.
-    - Gender: Patient's gender.
-    - Comorbidities: List of any chronic illnesses or conditions the patient has.
-    - Preferences: Specific dietary or personal preferences.
-
-    Food Details:
-    - Ingredients: A textual description listing all ingredients of the food.
-    - Nutri-Score Score: A numerical value indicating the nutritional quality.
-    - Nutri-Score Grade: A letter grade (e.g., A to E) summarizing the nutritional quality.
-    - NOVA Group: A classification of the food based on its level of processing.
-    - Allergens: A list of known allergens contained in the food.
-
-    Instructions:
-    Using the information provided below, assign a health suitability score between 0 and 100 that reflects how appropriate this food is for the patient. Consider the patient’s overall health profile—including age, weight, comorbidities, and lifestyle—as well as the food's nutritional indicators and ingredient list. In your evaluation, be sure to:
-    - Highlight any ingredients or food properties that may not suit the patient's health profile.
-    - Provide a brief reasoning for the score you assign. Limit your reasoning to no more than three concise sentences.
-
-    ---
-
-    Here is information about the patient:
-    Email: {email}
-    Height (cm): {height}
-    Weight (kg): {weight}
-    Age: {age}
-    Physical Activity Level: {physical_activity}
-    Gender: {gender}
-    Comorbidities: {comorbidities}
-    Preferences: {preferences}
-
-    Here is information about the food:
-    Ingredients: {ingredients_text}
-    Nutri-Score Score: {nutriscore_score}
-    Nutri-Score Grade: {nutriscore_grade}
-    NOVA Group: {nova_group}
-    Allergens: {allergens}
-
-    ---
-
-    Assign a score between 0 and 100 rating how healthy this food is for the patient, and include your concise reasoning below.
-    Be impersonable.
 
-    """
+class BatchItemResponse(BaseModel):
+    item: int = Field(description="Number of the item being scored, as given in the input")
+    score: int
+    reasoning: str
 
 
-)
+class BatchResponseFormatter(BaseModel):
+    results: List[BatchItemResponse]
 
 # model = ChatOpenAI(model="gpt-4o", temperature=0, api_key=os.getenv("OPENAI_API_KEY"))
 
 
+# Structured models are built once; include_raw keeps the response message so
+# its token usage can be reported.
+structured_llm = model.with_structured_output(ResponseFormatter, include_raw=True)
+batch_structured_llm = model.with_structured_output(BatchResponseFormatter, include_raw=True)
+
+
 def get_llm_response(user_info, food_info):
-    # Merge patient and food details into a single parameter dictionary.
-    params = {
-        "email": user_info.get("email", ""),
-        "height": user_info.get("height", 0.0),
-        "weight": user_info.get("weight", 0.0),
-        "age": user_info.get("age", 0),
-        "physical_activity": user_info.get("physical_activity", ""),
-        "gender": user_info.get("gender", ""),
-        "comorbidities": user_info.get("comorbidities", []),
-        "preferences": user_info.get("preferences", ""),
-        "ingredients_text": food_info.get("ingredients_text", ""),
-        "nutriscore_score": food_info.get("nutriscore_score", 0),
-        "nutriscore_grade": food_info.get("nutriscore_grade", ""),
-        "nova_group": food_info.get("nova_group", ""),
-        "allergens": food_info.get("allergens", ""),
-    }
+    # Static instructions come first so the provider can reuse the prefix.
+    messages = scoring_messages(user_info, food_info)
+    return invoke_structured(gemini, structured_llm, messages)
 
-    # Invoke the enhanced prompt template with the parameters.
 
-    prompt = prompt_template.invoke(params)
-    structured_llm = model.with_structured_output(ResponseFormatter)
-    # Call the language model with the generated prompt and return its response.
-    response = structured_llm.invoke(prompt)
-    return response
+def get_llm_responses(pairs):
+    """
+    Score several (user_info, food_info) pairs with a single model call.
+
+    Items the model leaves out of its answer are scored individually, so the
+    result always lines up with the input.
+
+    Args:
+        pairs: List of (user_info, food_info) tuples.
+
+    Returns:
+        A list of ResponseFormatter objects in the same order as pairs.
+    """
+    if len(pairs) == 1:
+        return [get_llm_response(*pairs[0])]
+
+    messages = batch_scoring_messages(pairs)
+    response = invoke_structured(gemini, batch_structured_llm, messages)
+
+    by_item = {
+        result.item: ResponseFormatter(score=result.score, reasoning=result.reasoning)
+        for result in response.results
+    }
+    return [
+        by_item.get(i) or get_llm_response(user_info, food_info)
+        for i, (user_info, food_info) in enumerate(pairs, 1)
+    ]
 
 if __name__ == '__main__':
     from open_food_api import get_product_info
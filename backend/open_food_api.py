@@ -1,8 +1,48 @@
+import os
+
 from openfoodfacts import API, APIVersion, Country, Environment, Flavor
 
+import http_clients  # noqa: F401
+from gtin import canonicalize
+from upstream import Dependency, TokenBucket
+
+OFF_TIMEOUT = float(os.getenv("OFF_TIMEOUT_S", "5"))
+
+open_food_facts = Dependency(
+    "open_food_facts",
+    timeout=OFF_TIMEOUT,
+    hedge_after=float(os.getenv("OFF_HEDGE_AFTER_S", "1")),
+    # Open Food Facts allows 100 product reads per minute per client.
+    rate_limiter=TokenBucket.from_env("OFF", default_per_minute=100),
+)
+
+PRODUCT_FIELDS = [
+    "product_name",
+    "image_front_url",
+    "image_url",
+    "ingredients_text",
+    "nutriscore_score",
+    "nutriscore_grade",
+    "nova_group",
+    "allergens",
+]
+
+# One long-lived API object; its requests go through the openfoodfacts
+# package's shared session, whose pool http_clients sizes on import.
+api = API(
+    user_agent="MyFoodApp",
+    country=Country.world,
+    flavor=Flavor.off,
+    version=APIVersion.v2,
+    environment=Environment.org,
+    timeout=OFF_TIMEOUT,
+)
+
 def get_product_info(upc_code: str):
     """
     Given a UPC code, fetch product data from Open Food Facts and print key details:
+        - Product name
+        - Front image URL
         - Ingredients text
         - Nutriments (as simple formatted text)
         - Nutriscore Score
@@ -13,21 +53,21 @@ def get_product_info(upc_code: str):
     If the product is not found, a message is displayed.
     """
 
-    # Instantiate the API object
-    api = API(
-        user_agent="MyFoodApp",
-        country=Country.world,
-        flavor=Flavor.off,
-        version=APIVersion.v2,
-        environment=Environment.org,
+    # Retrieve product details using the UPC code, falling back to the last
+    # good answer for this UPC if Open Food Facts is down.
+    upc_code = canonicalize(upc_code)
+    result = open_food_facts.call(
+        api.product.get,
+        upc_code,
+        fields=PRODUCT_FIELDS,
+        idempotent=True,
+        cache_key=upc_code,
     )
-
-    # Retrieve product details using the UPC code
-    result = api.product.get(upc_code, fields=["ingredients_text", "nutriscore_score", "nutriscore_grade", "nova_group", "allergens"])
     # print(result)
 
     return result
 
+
 # Example usage:
 if __name__ == "__main__":
     upc_code = input("Enter the UPC code: ").strip()
@@ -0,0 +1,70 @@
+from typing import Optional
+
+from pydantic import BaseModel
+
+from image_and_name import scrape_product_details
+from open_food_api import get_product_info
+
+
+class ProductNotFoundError(Exception):
+    """Open Food Facts has no product for this UPC."""
+
+
+class ProductRecord(BaseModel):
+    """Everything a scan needs to know about a product."""
+
+    upc: str
+    product_name: str = "Unknown Product"
+    image_url: Optional[str] = None
+    image_source: Optional[str] = None  # "open_food_facts" or "go_upc"
+    ingredients_text: str = ""
+    nutriscore_score: Optional[int] = None
+    nutriscore_grade: str = ""
+    nova_group: Optional[int] = None
+    allergens: str = ""
+
+
+def resolve_product(upc: str) -> ProductRecord:
+    """
+    Resolve a UPC into a single product record.
+
+    Name, image and nutrition data come from one Open Food Facts lookup.
+    Go-UPC is only scraped when Open Food Facts has no image, and its name
+    is used if Open Food Facts has none either.
+
+    Args:
+        upc: The UPC code to resolve.
+
+    Returns:
+        A ProductRecord. image_url is None if neither source has an image.
+
+    Raises:
+        ProductNotFoundError: If Open Food Facts does not know the product.
+    """
+    food_info = get_product_info(upc)
+    if not food_info:
+        raise ProductNotFoundError(f"Product {upc} was not found in Open Food Facts.")
+
+    record = ProductRecord(
+        upc=upc,
+        product_name=food_info.get("product_name") or "Unknown Product",
+        image_url=food_info.get("image_front_url") or food_info.get("image_url"),
+        ingredients_text=food_info.get("ingredients_text") or "",
+        nutriscore_score=food_info.get("nutriscore_score"),
+        nutriscore_grade=food_info.get("nutriscore_grade") or "",
+        nova_group=food_info.get("nova_group"),
+        allergens=food_info.get("allergens") or "",
+    )
+    if record.image_url:
+        record.image_source = "open_food_facts"
+        return record
+
+    try:
+        details = scrape_product_details(upc)
+        record.image_url = details["image"]
+        record.image_source = "go_upc"
+        if record.product_name == "Unknown Product" and details.get("name"):
+            record.product_name = details["name"]
+    except Exception as e:
+        print(f"Error fetching image for UPC {upc}: {e}")
+    return record
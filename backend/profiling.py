@@ -0,0 +1,281 @@
+import hmac
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+
+from starlette.datastructures import MutableHeaders
+
+_current_profile = ContextVar("request_profile", default=None)
+
+# Deepest stack kept per sample; deeper frames are cut at the root end.
+MAX_STACK_DEPTH = 64
+
+
+class RequestProfile:
+    """Stage timings and sampled call stacks of one request."""
+
+    def __init__(self, profile_id: str, method: str, path: str, sampled: bool):
+        self.id = profile_id
+        self.method = method
+        self.path = path
+        self.started_at = datetime.now().isoformat()
+        self.started = time.monotonic()
+        self.duration = None
+        self.status = None
+        # Whether call stacks are being sampled; set up front for sampled
+        # requests and later by the profiler for requests running long.
+        self.sampling = sampled
+        self.sampled = sampled
+        self.stages = []
+        self.stacks = Counter()
+        self.samples = 0
+        self.threads = set()
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 1) if self.duration is not None else None,
+            "sampled": self.sampled,
+            "samples": self.samples,
+        }
+
+    def to_dict(self, top: int = 50):
+        return dict(
+            self.summary(),
+            stages=self.stages,
+            top_stacks=[
+                {"stack": stack, "samples": count} for stack, count in self.stacks.most_common(top)
+            ],
+        )
+
+    def folded(self) -> str:
+        """Return the sampled stacks in the folded format flame graph tools read."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Time a named stage of the current request.
+
+    Outside a profiled request this does nothing. The calling thread is
+    also registered for call-stack sampling for the rest of the request.
+    """
+    profile = _current_profile.get()
+    if profile is None:
+        yield
+        return
+    profile.threads.add(threading.get_ident())
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        profile.stages.append(
+            {
+                "name": name,
+                "start_ms": round((started - profile.started) * 1000, 1),
+                "duration_ms": round((time.monotonic() - started) * 1000, 1),
+            }
+        )
+
+
+def _fold(frame) -> str:
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class Profiler:
+    """
+    Keep stage timings for every request and sample the call stacks of some.
+
+    Stacks are sampled for a fraction of requests, for requests that ask for
+    it, and for any request still running after ``arm_after`` seconds, so
+    slow requests are profiled without paying for it on fast ones. Sampled
+    and slow requests are kept in a ring buffer.
+
+    While any request is being sampled, the sampler thread takes the GIL
+    every ``interval`` to walk the stacks of all threads, which slows every
+    request in the process, not just the sampled one. Arming at
+    ``slow_threshold`` by default keeps that cost to requests that are
+    already slow; an earlier ``arm_after`` catches more of a slow request's
+    start at the price of also sampling requests that end up fast.
+    """
+
+    def __init__(
+        self,
+        sample_rate: float = 0.0,
+        slow_threshold: float = 2.0,
+        arm_after: float = None,
+        interval: float = 0.005,
+        buffer_size: int = 50,
+    ):
+        """
+        Args:
+            sample_rate: Fraction of requests to sample from the start.
+            slow_threshold: Requests taking at least this many seconds are kept.
+            arm_after: Seconds after which an unsampled request starts being
+                sampled. Defaults to slow_threshold.
+            interval: Seconds between stack samples.
+            buffer_size: Number of profiles kept; the oldest are dropped.
+        """
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.arm_after = slow_threshold if arm_after is None else arm_after
+        self.interval = interval
+        self.profiles = deque(maxlen=buffer_size)
+        self._active = set()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        # Set while any request is active; the sampler sleeps otherwise.
+        self._busy = threading.Event()
+        self._sampler = None
+
+    @classmethod
+    def from_env(cls):
+        """Build a profiler configured by the PROFILE_* environment variables."""
+        arm_after = os.getenv("PROFILE_ARM_AFTER_MS")
+        return cls(
+            sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0")),
+            slow_threshold=float(os.getenv("PROFILE_SLOW_MS", "2000")) / 1000,
+            arm_after=float(arm_after) / 1000 if arm_after else None,
+            interval=float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000,
+            buffer_size=int(os.getenv("PROFILE_BUFFER_SIZE", "50")),
+        )
+
+    def begin(self, method: str, path: str, force: bool = False) -> RequestProfile:
+        """Start profiling a request and make it current for stage()."""
+        sampled = force or random.random() < self.sample_rate
+        profile = RequestProfile(f"{next(self._ids):06d}", method, path, sampled)
+        with self._lock:
+            self._active.add(profile)
+            self._busy.set()
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+                self._sampler.start()
+        return profile
+
+    def end(self, profile: RequestProfile, status: int = None):
+        """Finish a request, keeping its profile if it was sampled or slow."""
+        profile.duration = time.monotonic() - profile.started
+        profile.status = status
+        with self._lock:
+            self._active.discard(profile)
+            if not self._active:
+                self._busy.clear()
+            if profile.sampled or profile.duration >= self.slow_threshold:
+                self.profiles.append(profile)
+
+    def get(self, profile_id: str):
+        with self._lock:
+            return next((p for p in self.profiles if p.id == profile_id), None)
+
+    def summaries(self):
+        with self._lock:
+            return [profile.summary() for profile in reversed(self.profiles)]
+
+    def stats(self):
+        with self._lock:
+            return {"active": len(self._active), "captured": len(self.profiles)}
+
+    def _sample_loop(self):
+        while True:
+            self._busy.wait()
+            time.sleep(self.interval)
+            self.sample()
+
+    def sample(self):
+        """Take one stack sample of every request being sampled."""
+        now = time.monotonic()
+        with self._lock:
+            active = list(self._active)
+        targets = []
+        for profile in active:
+            if not profile.sampling and now - profile.started >= self.arm_after:
+                profile.sampling = True
+            if profile.sampling and profile.threads:
+                targets.append(profile)
+        if not targets:
+            return
+        frames = sys._current_frames()
+        for profile in targets:
+            for thread_id in list(profile.threads):
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    profile.stacks[_fold(frame)] += 1
+                    profile.samples += 1
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that runs every HTTP request under a Profiler.
+
+    A request carrying the debug header and a valid admin token header is
+    always sampled, and its response carries an X-Profile-Id header naming
+    the stored profile. Without an admin token configured, the debug header
+    is ignored.
+    """
+
+    def __init__(
+        self,
+        app,
+        profiler: Profiler,
+        admin_token: str = None,
+        debug_header: str = "x-debug-profile",
+        admin_header: str = "x-admin-token",
+        exclude_prefix: str = "/admin/",
+    ):
+        self.app = app
+        self.profiler = profiler
+        self.admin_token = admin_token.encode("latin-1") if admin_token else None
+        self.debug_header = debug_header.lower().encode("latin-1")
+        self.admin_header = admin_header.lower().encode("latin-1")
+        self.exclude_prefix = exclude_prefix
+
+    def _forced(self, headers) -> bool:
+        if self.admin_token is None:
+            return False
+        headers = dict(headers)
+        token = headers.get(self.admin_header)
+        return (
+            self.debug_header in headers
+            and token is not None
+            and hmac.compare_digest(token, self.admin_token)
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.exclude_prefix):
+            await self.app(scope, receive, send)
+            return
+
+        profile = self.profiler.begin(scope["method"], scope["path"], force=self._forced(scope["headers"]))
+        token = _current_profile.set(profile)
+        status = None
+
+        async def send_with_profile_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if profile.sampled:
+                    MutableHeaders(scope=message)["X-Profile-Id"] = profile.id
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            _current_profile.reset(token)
+            self.profiler.end(profile, status)
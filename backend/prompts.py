@@ -0,0 +1,204 @@
+import threading
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+# Prompts are laid out from least to most variable: static instructions,
+# then the patient profile (stable across a user's scans), then the food.
+# Providers cache on exact prompt prefixes, so nothing request-specific may
+# appear in the instruction blocks, and fields that do not change the answer
+# (such as email) are left out entirely.
+
+FIELD_DEFINITIONS = """Patient Information:
+- Height: Patient's height in centimeters.
+- Weight: Patient's weight in kilograms.
+- Age: Patient's age in years.
+- Physical Activity Level: Description of the patient's daily movement or exercise habits.
+- Gender: Patient's gender.
+- Comorbidities: List of any chronic illnesses or conditions the patient has.
+- Preferences: Specific dietary or personal preferences.
+
+Food Details:
+- Ingredients: A textual description listing all ingredients of the food.
+- Nutri-Score Score: A numerical value indicating the nutritional quality.
+- Nutri-Score Grade: A letter grade (e.g., A to E) summarizing the nutritional quality.
+- NOVA Group: A classification of the food based on its level of processing.
+- Allergens: A list of known allergens contained in the food."""
+
+SCORING_INSTRUCTIONS = f"""You evaluate how healthy a specific food is for a patient, using fields from two distinct sources: the patient's health record and detailed food information. Each field is defined as follows:
+
+{FIELD_DEFINITIONS}
+
+Instructions:
+Using the patient and food information in the next message, assign a health suitability score between 0 and 100 that reflects how appropriate this food is for the patient. Consider the patient’s overall health profile—including age, weight, comorbidities, and lifestyle—as well as the food's nutritional indicators and ingredient list. In your evaluation, be sure to:
+- Highlight any ingredients or food properties that may not suit the patient's health profile.
+- Provide a brief reasoning for the score you assign. Limit your reasoning to no more than three concise sentences.
+
+Assign a score between 0 and 100 rating how healthy this food is for the patient, and include your concise reasoning.
+Be impersonable."""
+
+BATCH_SCORING_INSTRUCTIONS = f"""You will evaluate several independent patient and food pairs. Each item pairs one patient's health record with one food. Score every item on its own; never let one item influence another. Each field is defined as follows:
+
+{FIELD_DEFINITIONS}
+
+Instructions:
+For each item in the next message, assign a health suitability score between 0 and 100 that reflects how appropriate the food is for that item's patient. Consider the patient’s overall health profile—including age, weight, comorbidities, and lifestyle—as well as the food's nutritional indicators and ingredient list. In your evaluation, be sure to:
+- Highlight any ingredients or food properties that may not suit the patient's health profile.
+- Provide a brief reasoning for the score you assign. Limit your reasoning to no more than three concise sentences.
+
+Return exactly one result per item, tagged with the item's number, each with a score between 0 and 100 and concise reasoning.
+Be impersonable."""
+
+RANKING_INSTRUCTIONS = """You are a nutrition expert tasked with ranking foods based on their healthiness for a specific patient.
+
+The next message describes the patient, followed by a list of foods the patient has scanned in the past.
+
+Please analyze these foods and rank the top 3 healthiest options specifically for this patient.
+For each recommended food, provide:
+1. A score between 0-100 indicating how healthy it is for this patient
+2. A brief reasoning (2-3 sentences) explaining why this food is recommended for this specific patient
+3. Return the food's name, image URL, and UPC exactly as provided in the input
+
+Consider the patient's health profile, comorbidities, and preferences when making recommendations.
+Focus on foods that would benefit this specific patient's health situation."""
+
+
+def _format_list(value) -> str:
+    if isinstance(value, (list, tuple)):
+        return ", ".join(str(v) for v in value) or "None"
+    return str(value) if value else "None"
+
+
+def profile_block(user_info: dict) -> str:
+    """
+    Describe the patient for a prompt.
+
+    The output depends only on fields that affect the answer, in a fixed
+    order, so it is byte-identical across a user's requests.
+    """
+    return (
+        "Here is information about the patient:\n"
+        f"Height (cm): {user_info.get('height', 0.0)}\n"
+        f"Weight (kg): {user_info.get('weight', 0.0)}\n"
+        f"Age: {user_info.get('age', 0)}\n"
+        f"Physical Activity Level: {user_info.get('physical_activity', '')}\n"
+        f"Gender: {user_info.get('gender', '')}\n"
+        f"Comorbidities: {_format_list(user_info.get('comorbidities', []))}\n"
+        f"Preferences: {user_info.get('preferences', '')}\n"
+    )
+
+
+def food_block(food_info: dict) -> str:
+    """Describe a scanned food for a scoring prompt."""
+    return (
+        "Here is information about the food:\n"
+        f"Ingredients: {food_info.get('ingredients_text', '')}\n"
+        f"Nutri-Score Score: {food_info.get('nutriscore_score', 0)}\n"
+        f"Nutri-Score Grade: {food_info.get('nutriscore_grade', '')}\n"
+        f"NOVA Group: {food_info.get('nova_group', '')}\n"
+        f"Allergens: {food_info.get('allergens', '')}\n"
+    )
+
+
+def scoring_messages(user_info: dict, food_info: dict) -> list:
+    """Build the messages for scoring one food for one patient."""
+    return [
+        SystemMessage(SCORING_INSTRUCTIONS),
+        HumanMessage(profile_block(user_info) + "\n" + food_block(food_info)),
+    ]
+
+
+def batch_scoring_messages(pairs: list) -> list:
+    """
+    Build the messages for scoring several (user_info, food_info) pairs,
+    numbering the items from 1.
+    """
+    items = "\n".join(
+        f"Item {i}:\n{profile_block(user_info)}\n{food_block(food_info)}"
+        for i, (user_info, food_info) in enumerate(pairs, 1)
+    )
+    return [SystemMessage(BATCH_SCORING_INSTRUCTIONS), HumanMessage(items)]
+
+
+def ranking_messages(user_info: dict, food_list: str) -> list:
+    """Build the messages for ranking a patient's scanned foods."""
+    return [
+        SystemMessage(RANKING_INSTRUCTIONS),
+        HumanMessage(
+            profile_block(user_info)
+            + "\nBelow is a list of foods the patient has scanned in the past:\n"
+            + food_list
+        ),
+    ]
+
+
+class TokenUsage:
+    """
+    Running totals of input, cached input and output tokens per provider,
+    read from the usage metadata LangChain attaches to model responses.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {}
+
+    def record(self, provider: str, message) -> dict:
+        """
+        Add the usage reported on one response message.
+
+        Returns:
+            The usage of this call as a dict, with zeros if the provider did
+            not report it.
+        """
+        metadata = getattr(message, "usage_metadata", None) or {}
+        details = metadata.get("input_token_details") or {}
+        usage = {
+            "input_tokens": metadata.get("input_tokens", 0),
+            "cached_tokens": details.get("cache_read") or 0,
+            "output_tokens": metadata.get("output_tokens", 0),
+        }
+        with self._lock:
+            totals = self._totals.setdefault(
+                provider, {"calls": 0, "input_tokens": 0, "cached_tokens": 0, "output_tokens": 0}
+            )
+            totals["calls"] += 1
+            for key, value in usage.items():
+                totals[key] += value
+        print(
+            f"{provider} tokens: input={usage['input_tokens']} "
+            f"cached={usage['cached_tokens']} output={usage['output_tokens']}"
+        )
+        return usage
+
+    def stats(self):
+        with self._lock:
+            return {
+                provider: dict(
+                    totals,
+                    cache_hit_rate=round(totals["cached_tokens"] / totals["input_tokens"], 3)
+                    if totals["input_tokens"]
+                    else 0.0,
+                )
+                for provider, totals in self._totals.items()
+            }
+
+
+token_usage = TokenUsage()
+
+
+def invoke_structured(dependency, structured_model, messages):
+    """
+    Call a model built with ``with_structured_output(..., include_raw=True)``
+    through an upstream Dependency and record its token usage.
+
+    Returns:
+        The parsed structured output.
+
+    Raises:
+        Whatever the dependency raises, or the parsing error if the model's
+        answer did not match the schema.
+    """
+    result = dependency.call(structured_model.invoke, messages)
+    token_usage.record(dependency.name, result["raw"])
+    if result.get("parsing_error") is not None:
+        raise result["parsing_error"]
+    return result["parsed"]
@@ -1,9 +1,12 @@
 from langchain_openai import ChatOpenAI
-from langchain_core.prompts import PromptTemplate
 from pydantic import BaseModel, Field
 from typing import List, Dict, Any
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from open_food_api import get_product_info
+from prompts import invoke_structured, ranking_messages
+from upstream import Dependency, TokenBucket, remaining_time, request_deadline
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -20,38 +23,31 @@ class RecommendationResult(BaseModel):
     """Result containing top recommendations"""
     recommendations: List[FoodRecommendation]
 
-# Prompt template for ranking foods
-ranking_prompt_template = PromptTemplate.from_template(
-    """
-    You are a nutrition expert tasked with ranking foods based on their healthiness for a specific patient.
-    
-    Here is information about the patient:
-    Email: {email}
-    Height (cm): {height}
-    Weight (kg): {weight}
-    Age: {age}
-    Physical Activity Level: {physical_activity}
-    Gender: {gender}
-    Comorbidities: {comorbidities}
-    Preferences: {preferences}
-    
-    Below is a list of foods the patient has scanned in the past:
-    {food_list}
-    
-    Please analyze these foods and rank the top 3 healthiest options specifically for this patient.
-    For each recommended food, provide:
-    1. A score between 0-100 indicating how healthy it is for this patient
-    2. A brief reasoning (2-3 sentences) explaining why this food is recommended for this specific patient
-    3. Return the food's name, image URL, and UPC exactly as provided in the input
-    
-    Consider the patient's health profile, comorbidities, and preferences when making recommendations.
-    Focus on foods that would benefit this specific patient's health situation.
-    """
+# Initialize the LLM
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT_S", "60"))
+# OpenAI caches prompt prefixes of 1024+ tokens automatically; a shared
+# cache key routes every ranking request, whose prompts all start with the
+# same instructions, to the same cache.
+OPENAI_PROMPT_CACHE_KEY = os.getenv("OPENAI_PROMPT_CACHE_KEY", "cleanse-ranking-v1")
+model = ChatOpenAI(
+    model="gpt-4o",
+    temperature=0.2,
+    timeout=OPENAI_TIMEOUT,
+    # The client retries twice by default; the Dependency's timeout must
+    # bound the whole call.
+    max_retries=0,
+    api_key=os.getenv("OPENAI_API_KEY"),
+    extra_body={"prompt_cache_key": OPENAI_PROMPT_CACHE_KEY} if OPENAI_PROMPT_CACHE_KEY else None,
 )
+structured_model = model.with_structured_output(RecommendationResult, include_raw=True)
+openai_gpt = Dependency("openai", timeout=OPENAI_TIMEOUT, rate_limiter=TokenBucket.from_env("OPENAI"))
 
-# Initialize the LLM
-model = ChatOpenAI(model="gpt-4o", temperature=0.2, api_key=os.getenv("OPENAI_API_KEY"))
-structured_model = model.with_structured_output(RecommendationResult)
+# Product names for history items are looked up concurrently, within a
+# deadline for the whole batch.
+UNKNOWN_PRODUCT = "Unknown Product"
+ENRICH_WORKERS = int(os.getenv("ENRICH_WORKERS", "8"))
+ENRICH_DEADLINE = float(os.getenv("ENRICH_DEADLINE_S", "5"))
+_enrich_executor = ThreadPoolExecutor(max_workers=ENRICH_WORKERS, thread_name_prefix="enrich")
 
 def format_food_list(history_items: List[Dict[str, Any]]) -> str:
     """Format the food history items for the prompt"""
@@ -83,53 +79,74 @@ def get_food_recommendations(user_info: Dict[str, Any], history_items: List[Dict
     # Format the food list for the prompt
     food_list_text = format_food_list(history_items)
     
-    # Create the prompt parameters
-    params = {
-        "email": user_info.get("email", ""),
-        "height": user_info.get("height", 0.0),
-        "weight": user_info.get("weight", 0.0),
-        "age": user_info.get("age", 0),
-        "physical_activity": user_info.get("physical_activity", ""),
-        "gender": user_info.get("gender", ""),
-        "comorbidities": user_info.get("comorbidities", []),
-        "preferences": user_info.get("preferences", ""),
-        "food_list": food_list_text
-    }
-    
     # Create the prompt and call the LLM
-    prompt = ranking_prompt_template.invoke(params)
-    recommendations = structured_model.invoke(prompt)
+    messages = ranking_messages(user_info, food_list_text)
+    recommendations = invoke_structured(openai_gpt, structured_model, messages)
     
     return recommendations
 
-def enrich_food_data(history_items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def _has_name(item: Dict[str, Any]) -> bool:
+    name = (item.get("product_name") or item.get("name") or "").strip()
+    return bool(name) and name != UNKNOWN_PRODUCT
+
+
+def _lookup_name(upc: str, deadline: float):
+    # Bound the lookup itself, not just the wait for it, so slow calls do
+    # not keep pool threads busy after the batch has given up on them.
+    with request_deadline(max(0.0, deadline - time.monotonic())):
+        food_info = get_product_info(upc)
+    name = ((food_info or {}).get("product_name") or "").strip()
+    return name if name != UNKNOWN_PRODUCT else ""
+
+
+def enrich_food_data(history_items: List[Dict[str, Any]], db_manager=None) -> List[Dict[str, Any]]:
     """
     Fetch additional food information for history items if needed.
     This is useful if the history items don't have all the required information.
-    
+
+    Items without a usable name are looked up once per UPC, concurrently and
+    within ENRICH_DEADLINE seconds; lookups that fail or run late leave the
+    item named "Unknown Product".
+
     Args:
         history_items: List of history items from the database
-        
+        db_manager: (Optional) Database to write the names found back to, so
+            later calls do not look them up again.
+
     Returns:
         Enriched list of history items with additional food information
     """
-    enriched_items = []
-    
-    for item in history_items:
-        # Check if we need to fetch additional information
-        if "product_name" not in item and ("name" not in item or not item.get("name")):
-            # Try to fetch food info from the API
+    missing = [item for item in history_items if not _has_name(item)]
+    upcs = list(dict.fromkeys(item["upc"] for item in missing))
+    names = {}
+
+    if upcs:
+        budget = ENRICH_DEADLINE
+        if remaining_time() is not None:
+            budget = min(budget, remaining_time())
+        deadline = time.monotonic() + budget
+        futures = {_enrich_executor.submit(_lookup_name, upc, deadline): upc for upc in upcs}
+        done, not_done = wait(futures, timeout=budget)
+        for future in not_done:
+            future.cancel()
+            print(f"Timed out fetching food info for UPC {futures[future]}")
+        for future in done:
+            upc = futures[future]
             try:
-                food_info = get_product_info(item["upc"])
-                item["name"] = food_info.get("product_name", "Unknown Product")
-                # Add any other missing fields you need
+                name = future.result()
             except Exception as e:
-                print(f"Error fetching food info for UPC {item.get('upc')}: {e}")
-                item["name"] = "Unknown Product"
-        
-        enriched_items.append(item)
-    
-    return enriched_items
+                print(f"Error fetching food info for UPC {upc}: {e}")
+                continue
+            if name:
+                names[upc] = name
+
+    for item in missing:
+        item["name"] = item["product_name"] = names.get(item["upc"], UNKNOWN_PRODUCT)
+
+    if db_manager is not None and names:
+        db_manager.set_product_names(names)
+
+    return history_items
 
 # Test the recommendation system
 if __name__ == "__main__":
@@ -147,7 +164,7 @@ if __name__ == "__main__":
         history_items = db_manager.get_user_history(test_email)
         
         # Enrich the food data
-        enriched_items = enrich_food_data(history_items)
+        enriched_items = enrich_food_data(history_items, db_manager)
         
         # Get recommendations
         recommendations = get_food_recommendations(user_info, enriched_items)
@@ -0,0 +1,170 @@
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from database import DatabaseManager, shard_file
+
+
+def _insert(conn, table: str, row):
+    columns = row.keys()
+    conn.execute(
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))});",
+        tuple(row),
+    )
+
+
+def _count(db_manager: DatabaseManager, table: str) -> int:
+    return sum(conn.execute(f"SELECT COUNT(*) FROM {table};").fetchone()[0] for conn in db_manager.shards)
+
+
+def reshard(db_file: str, from_shards: int, to_shards: int, keep_source: bool = False, batch_size: int = 1000):
+    """
+    Move every user and their history from one shard layout to another.
+
+    Run it while the server is stopped. Entries keep their ids, and every new
+    shard continues numbering above the highest id ever used, so archived and
+    exported ids stay valid. Export cursors are not carried over: positions
+    within the old shards mean nothing in the new ones, so consumers start
+    again with a full export. The shared tables in the primary file are not
+    touched.
+
+    Args:
+        db_file: Path of the primary database file.
+        from_shards: Current number of shards.
+        to_shards: New number of shards.
+        keep_source: Keep the old layout's data instead of removing it once
+            the copy has been verified. DatabaseManager refuses to open
+            the new layout until the old data is gone.
+        batch_size: Number of history entries copied per transaction.
+
+    Returns:
+        A (users, history entries) tuple of the number of rows moved.
+
+    Raises:
+        ValueError: If the layouts are the same or the new one already has data.
+    """
+    if from_shards == to_shards:
+        raise ValueError("The source and target shard counts are the same.")
+    source = DatabaseManager(db_file, shards=from_shards, check_layout=False)
+    target = DatabaseManager(db_file, shards=to_shards, check_layout=False)
+    try:
+        if _count(target, "Users") or _count(target, "History"):
+            raise ValueError(f"The {to_shards}-shard layout of {db_file} already has data.")
+
+        id_floor = 0
+        for conn in source.shards:
+            for user in conn.execute("SELECT * FROM Users;"):
+                _insert(target.shards[target.shard_index(user["email"])], "Users", user)
+            row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'History';").fetchone()
+            id_floor = max(id_floor, row["seq"] if row else 0)
+        for conn in target.shards:
+            conn.commit()
+
+        for conn in source.shards:
+            last_id = 0
+            while True:
+                rows = conn.execute(
+                    "SELECT * FROM History WHERE id > ? ORDER BY id LIMIT ?;", (last_id, batch_size)
+                ).fetchall()
+                if not rows:
+                    break
+                for row in rows:
+                    _insert(target.shards[target.shard_index(row["email"])], "History", row)
+                for dest in target.shards:
+                    dest.commit()
+                last_id = rows[-1]["id"]
+
+        # New ids must not reuse any id handed out under the old layout.
+        for conn in target.shards:
+            cursor = conn.execute(
+                "UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'History';", (id_floor,)
+            )
+            if cursor.rowcount == 0:
+                conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('History', ?);", (id_floor,))
+            conn.commit()
+
+        moved = (_count(target, "Users"), _count(target, "History"))
+        if moved != (_count(source, "Users"), _count(source, "History")):
+            raise RuntimeError(f"Copy is incomplete; the {from_shards}-shard layout was left as it was.")
+
+        if not keep_source:
+            source.clear_database()
+            for conn in source.shards:
+                conn.execute("DELETE FROM ExportCursors;")
+                conn.commit()
+    finally:
+        source.close()
+        target.close()
+
+    if not keep_source and from_shards > 1:
+        for index in range(from_shards):
+            os.remove(shard_file(db_file, index, from_shards))
+    return moved
+
+
+def benchmark_writes(shard_counts=(1, 2, 4, 8), writers: int = 16, writes_per_writer: int = 200, directory: str = None):
+    """
+    Measure add_history throughput with concurrent writers for each shard count.
+
+    Args:
+        shard_counts: Shard counts to compare.
+        writers: Number of writer threads, each writing for its own users.
+        writes_per_writer: Number of history entries each thread adds.
+        directory: (Optional) Where to create the databases. Use a directory
+            on the production disk: commit cost depends on fsync speed.
+
+    Returns:
+        A dictionary of shard count to writes per second.
+    """
+    results = {}
+    for count in shard_counts:
+        with tempfile.TemporaryDirectory(dir=directory) as tmp_dir:
+            db_manager = DatabaseManager(os.path.join(tmp_dir, "benchmark.db"), shards=count)
+            emails = [f"user{i}@example.com" for i in range(writers * 4)]
+            for email in emails:
+                db_manager.add_user(email, 170.0, 65.0, 30, "Moderate", "Female", [], "")
+
+            def write(worker):
+                for i in range(writes_per_writer):
+                    email = emails[(worker + i * writers) % len(emails)]
+                    db_manager.add_history(email, "049000031652", 50, "Benchmark entry.", "")
+
+            threads = [threading.Thread(target=write, args=(worker,)) for worker in range(writers)]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+            db_manager.close()
+        results[count] = writers * writes_per_writer / elapsed
+    return results
+
+
+# Example usage:
+#   python reshard.py move --db example.db --from 1 --to 4
+#   python reshard.py benchmark --shards 1 2 4 8
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reshard the database or benchmark shard counts.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    move = commands.add_parser("move", help="Move data to a new shard count.")
+    move.add_argument("--db", default="example.db")
+    move.add_argument("--from", dest="from_shards", type=int, required=True)
+    move.add_argument("--to", dest="to_shards", type=int, required=True)
+    move.add_argument("--keep-source", action="store_true")
+    bench = commands.add_parser("benchmark", help="Measure write throughput per shard count.")
+    bench.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    bench.add_argument("--writers", type=int, default=16)
+    bench.add_argument("--writes", type=int, default=200)
+    bench.add_argument("--dir", help="Directory for the benchmark databases.")
+    args = parser.parse_args()
+
+    if args.command == "move":
+        users, entries = reshard(args.db, args.from_shards, args.to_shards, args.keep_source)
+        print(f"Moved {users} users and {entries} history entries to {args.to_shards} shards.")
+        print("Export cursors were reset; incremental consumers will receive a full export.")
+    else:
+        for count, rate in benchmark_writes(args.shards, args.writers, args.writes, args.dir).items():
+            print(f"{count:>3} shard(s): {rate:8.0f} writes/s")
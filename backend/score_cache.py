@@ -0,0 +1,185 @@
+import hashlib
+import json
+import re
+import threading
+
+from database import DatabaseManager
+
+# Profile fields that feed the scoring prompt. Email is left out on purpose:
+# it identifies the user but says nothing about their health.
+PROFILE_FIELDS = [
+    "height",
+    "weight",
+    "age",
+    "physical_activity",
+    "gender",
+    "comorbidities",
+    "preferences",
+]
+
+
+def _hash(value) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _normalize_text(value) -> str:
+    text = str(value or "").lower()
+    text = re.sub(r"[\s_]+", " ", text)
+    return text.strip(" .;,")
+
+
+def normalize_food_fields(food_info: dict) -> dict:
+    """
+    Normalize the food fields used by prompts.food_block.
+
+    Case, whitespace, trailing punctuation and allergen order are ignored, so
+    the same product sold under different UPCs normalizes identically.
+    """
+    allergens = {
+        _normalize_text(allergen)
+        for allergen in str(food_info.get("allergens") or "").split(",")
+    }
+    return {
+        "ingredients_text": _normalize_text(food_info.get("ingredients_text")),
+        "nutriscore_score": food_info.get("nutriscore_score"),
+        "nutriscore_grade": _normalize_text(food_info.get("nutriscore_grade")),
+        "nova_group": _normalize_text(food_info.get("nova_group")),
+        "allergens": sorted(allergen for allergen in allergens if allergen),
+    }
+
+
+def food_fingerprint(food_info: dict):
+    """
+    Return a content fingerprint for a food, or None if the food has no
+    ingredient list to tell it apart from other products.
+    """
+    if not food_info:
+        return None
+    normalized = normalize_food_fields(food_info)
+    if not normalized["ingredients_text"]:
+        return None
+    return _hash(normalized)
+
+
+def profile_hash(user_info: dict) -> str:
+    """Return a hash of the profile fields that feed the scoring prompt."""
+    profile = {field: user_info.get(field) for field in PROFILE_FIELDS}
+    profile["comorbidities"] = sorted(
+        _normalize_text(c) for c in profile["comorbidities"] or []
+    )
+    return _hash(profile)
+
+
+class ScoreCache:
+    """
+    Reuse LLM scores across UPCs whose food content is identical.
+
+    Scores are stored in the database keyed on (profile hash, food
+    fingerprint), so a multipack or regional code scores instantly once any
+    product with the same ingredients has been scored for the same profile.
+    """
+
+    def __init__(self, db_manager: DatabaseManager):
+        self.db_manager = db_manager
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _keys(self, user_info, food_info):
+        fingerprint = food_fingerprint(food_info)
+        if fingerprint is None:
+            return None
+        return f"profile:{profile_hash(user_info)}", f"fp:{fingerprint}"
+
+    def lookup(self, user_info: dict, food_info: dict):
+        """
+        Return the cached score for this profile and food content.
+
+        Returns:
+            A dictionary with "score" and "reasoning" or None on a miss.
+        """
+        keys = self._keys(user_info, food_info)
+        cached = self.db_manager.get_cached_score(*keys) if keys else None
+        with self._lock:
+            if cached:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return cached
+
+    def store(self, user_info: dict, food_info: dict, score: int, reasoning: str):
+        """Cache a score for this profile and food content."""
+        keys = self._keys(user_info, food_info)
+        if keys:
+            self.db_manager.cache_score(*keys, score, reasoning)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+def replay_report(db_manager: DatabaseManager, get_food_info):
+    """
+    Replay the scan log in History and compare a per-UPC score cache with a
+    fingerprint cache.
+
+    Args:
+        db_manager: Database holding the scan log.
+        get_food_info: Function returning food information for a UPC.
+
+    Returns:
+        A dictionary with the number of scans, hits for each cache, and the
+        extra hit rate the fingerprint cache adds.
+    """
+    food_by_upc = {}
+    profiles = {}
+    seen_upc_keys = set()
+    seen_fp_keys = set()
+    upc_hits = 0
+    fingerprint_hits = 0
+
+    entries = db_manager.get_all_history()
+    for entry in entries:
+        email, upc = entry["email"], entry["upc"]
+        if email not in profiles:
+            profiles[email] = profile_hash(db_manager.get_user(email) or {})
+        if upc not in food_by_upc:
+            try:
+                food_by_upc[upc] = get_food_info(upc) or {}
+            except Exception as e:
+                print(f"Error fetching food info for UPC {upc}: {e}")
+                food_by_upc[upc] = {}
+
+        upc_key = (profiles[email], upc)
+        fingerprint = food_fingerprint(food_by_upc[upc])
+        fp_key = (profiles[email], fingerprint or f"upc:{upc}")
+
+        if upc_key in seen_upc_keys:
+            upc_hits += 1
+        if fp_key in seen_fp_keys:
+            fingerprint_hits += 1
+        seen_upc_keys.add(upc_key)
+        seen_fp_keys.add(fp_key)
+
+    scans = len(entries)
+    return {
+        "scans": scans,
+        "distinct_upcs": len(food_by_upc),
+        "upc_hit_rate": upc_hits / scans if scans else 0.0,
+        "fingerprint_hit_rate": fingerprint_hits / scans if scans else 0.0,
+        "extra_hit_rate": (fingerprint_hits - upc_hits) / scans if scans else 0.0,
+    }
+
+
+# Example usage: report the extra hit rate on the recorded scan log.
+if __name__ == "__main__":
+    from open_food_api import get_product_info
+
+    db_manager = DatabaseManager("example.db")
+    print(replay_report(db_manager, get_product_info))
+    db_manager.close()
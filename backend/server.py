@@ -1,19 +1,88 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime
+import hmac
+import os
 
-from image_and_name import scrape_image
 from database import DatabaseManager  # Ensure this module is in your project
-from llm_stuff import get_llm_response
-from open_food_api import get_product_info
+from llm_stuff import get_llm_responses
+from llm_batcher import ScoringBatcher
+from product_resolver import resolve_product
 from recommendation import get_food_recommendations, enrich_food_data
+from history_archive import HistoryArchiver
+from export import FORMATS, export_history
+from gtin import InvalidGTIN, canonicalize
+from score_cache import ScoreCache
+from cohort import CohortScoreCache
+import upstream
+from admission import AdmissionController, AdmissionMiddleware, RoutePolicy
+from http_clients import WORKER_CONCURRENCY
+from http_caching import FastJSONResponse, cached_json, etag_matches, not_modified, user_etag
+from prompts import token_usage
+from profiling import Profiler, ProfilingMiddleware, stage
+from upstream import remaining_time, request_deadline
+
+# End-to-end time budget for /add_history, shared by every upstream call it makes.
+ADD_HISTORY_DEADLINE = float(os.getenv("ADD_HISTORY_DEADLINE_S", "30"))
+
+# Image shown when no product image can be found.
+DEFAULT_IMAGE_URL = "https://cdn-icons-png.flaticon.com/512/1828/1828843.png"
 
 # Create a single global instance of the DatabaseManager.
-db_manager = DatabaseManager("example.db")
+db_manager = DatabaseManager(os.getenv("DB_FILE", "example.db"))
+
+# Old history is moved out of the database by history_archive.py; this
+# instance is only used to read it back on demand.
+history_archiver = HistoryArchiver(db_manager)
+
+# Longest date range /get_archived_history reads in one request.
+ARCHIVE_QUERY_MAX_DAYS = int(os.getenv("ARCHIVE_QUERY_MAX_DAYS", "366"))
+
+# Scores are reused across UPCs whose food content is identical.
+score_cache = ScoreCache(db_manager)
+
+# Optional cohort mode: users with equivalent health profiles share scores
+# per UPC. Enable with COHORT_SCORING=1.
+cohort_cache = CohortScoreCache(db_manager) if os.getenv("COHORT_SCORING") == "1" else None
+
+# Scoring calls from concurrent /add_history requests are grouped into a
+# single model call; set LLM_BATCH_WINDOW_MS=0 to score each one on its own.
+scoring_batcher = ScoringBatcher(
+    get_llm_responses,
+    window=float(os.getenv("LLM_BATCH_WINDOW_MS", "50")) / 1000,
+    max_batch_size=int(os.getenv("LLM_BATCH_MAX_SIZE", "8")),
+)
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
+
+# Compress larger responses (history lists, exports) for clients that accept gzip.
+app.add_middleware(GZipMiddleware, minimum_size=1000)
+
+# Scans and recommendations share the worker threadpool (40 threads by
+# default). Scans are what users wait on, so they are admitted first and
+# recommendations are shed first when the pool is saturated.
+admission_controller = AdmissionController(
+    {
+        "/add_history": RoutePolicy(priority=0, max_concurrent=32, max_wait=5.0),
+        "/get_recommendations": RoutePolicy(priority=1, max_concurrent=4, max_wait=10.0),
+    },
+    total_slots=WORKER_CONCURRENCY,
+)
+app.add_middleware(AdmissionMiddleware, controller=admission_controller)
+
+# Time the stages of every request and keep the call-stack profiles of
+# sampled and slow ones (see the PROFILE_* variables). Send the
+# X-Debug-Profile header with X-Admin-Token to have a request sampled.
+profiler = Profiler.from_env()
+
+# Token required by the /admin endpoints; they are disabled when unset.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+app.add_middleware(ProfilingMiddleware, profiler=profiler, admin_token=ADMIN_TOKEN)
 
 # Enable CORS from any origin.
 app.add_middleware(
@@ -67,12 +136,25 @@ def add_user(user: UserModel):
 
 @app.post("/add_history")
 def add_history(history: HistoryInputModel):
+    # Key every lookup, cache and row on the canonical form of the code.
+    try:
+        history.upc = canonicalize(history.upc, strict=True)
+    except InvalidGTIN as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    # Bound the whole request, including every upstream call it makes.
+    with request_deadline(ADD_HISTORY_DEADLINE):
+        return _add_history(history)
+
+
+def _add_history(history: HistoryInputModel):
     print(f"Received add_history request for email: {history.email}, UPC: {history.upc}")
     
     try:
         # First check if we already have a very recent scan of this UPC for this user
         # to prevent duplicate entries from double-scans
-        existing_entries = db_manager.get_user_history(history.email)
+        with stage("history_lookup"):
+            existing_entries = db_manager.get_user_history(history.email)
         
         if existing_entries:
             # Check for entries with same UPC in the last 1 minute
@@ -96,14 +178,19 @@ def add_history(history: HistoryInputModel):
                         # Continue processing if date parsing fails
         
         # Retrieve food information using the provided UPC.
-        food_info = get_product_info(history.upc)
+        # Name, image and nutrition data come back from a single lookup.
+        with stage("resolve_product"):
+            product = resolve_product(history.upc)
+        food_info = product.model_dump()
         print(f"Retrieved food info: {food_info}")
         
-        # Get product name from food info
-        product_name = food_info.get("product_name", "Unknown Product")
+        # Get product name and image from the product record
+        product_name = product.product_name
+        image_url = product.image_url or DEFAULT_IMAGE_URL
         
         # Retrieve user details from the database using the provided email.
-        user_info = db_manager.get_user(history.email)
+        with stage("user_lookup"):
+            user_info = db_manager.get_user(history.email)
         print(f"User lookup result: {user_info}")
 
         # If user doesn't exist, create a default user
@@ -152,32 +239,48 @@ def add_history(history: HistoryInputModel):
                     "preferences": "No specific preferences"
                 }
 
-        # Call the LLM to evaluate the food against the user's profile.
-        print(f"Calling LLM with user_info: {user_info} and food_info: {food_info}")
-        llm_response = get_llm_response(user_info, food_info)
-        print(f"LLM response: {llm_response}")
-
-        # Call scrape_image to get the image URL from the UPC.
-        image_url = scrape_image(history.upc)
+        # Reuse a score for this user's cohort or for identical food content if
+        # one exists; otherwise call the LLM to evaluate the food against the
+        # user's profile.
+        with stage("score_cache"):
+            cached_score = cohort_cache.lookup(user_info, history.upc) if cohort_cache else None
+            if cached_score:
+                print(f"Reusing cohort score for UPC {history.upc}: {cached_score}")
+            else:
+                cached_score = score_cache.lookup(user_info, food_info)
+        if cached_score:
+            print(f"Reusing cached score for UPC {history.upc}: {cached_score}")
+            score, reasoning = cached_score["score"], cached_score["reasoning"]
+        else:
+            print(f"Calling LLM with user_info: {user_info} and food_info: {food_info}")
+            with stage("llm_score"):
+                llm_response = scoring_batcher.score(user_info, food_info, timeout=remaining_time())
+            print(f"LLM response: {llm_response}")
+            score, reasoning = llm_response.score, llm_response.reasoning
+            score_cache.store(user_info, food_info, score, reasoning)
+            if cohort_cache:
+                cohort_cache.store(user_info, history.upc, score, reasoning)
 
         # Automatically set the current date and time (in ISO format).
         current_date = datetime.now().isoformat()
 
         # Store the history entry in the database
-        db_manager.add_history(
-            email=history.email,
-            upc=history.upc,
-            score=llm_response.score,
-            reasoning=llm_response.reasoning,
-            image_url=image_url,
-            date=current_date,
-            product_name=product_name,
-        )
+        with stage("store"):
+            db_manager.add_history(
+                email=history.email,
+                upc=history.upc,
+                score=score,
+                reasoning=reasoning,
+                image_url=image_url,
+                date=current_date,
+                product_name=product_name,
+                ingredients_text=product.ingredients_text,
+            )
         
         # Return the response
         result = {
-            "score": llm_response.score,
-            "reasoning": llm_response.reasoning,
+            "score": score,
+            "reasoning": reasoning,
             "image_url": image_url,
             "product_name": product_name,
         }
@@ -190,18 +293,92 @@ def add_history(history: HistoryInputModel):
         return {
             "score": 50,
             "reasoning": f"Error processing product: {str(e)}. Please try again.",
-            "image_url": "https://cdn-icons-png.flaticon.com/512/1828/1828843.png",
+            "image_url": DEFAULT_IMAGE_URL,
             "product_name": "Unknown Product" 
         }
 
 
 @app.get("/get_history")
-def get_history(email: str):
+def get_history(email: str, if_none_match: Optional[str] = Header(None)):
+    # Answer polls for unchanged history from the user's version alone.
+    etag = user_etag(db_manager, email, "history")
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
     history_list = db_manager.get_user_history(email)
     if not history_list:
         # Return an empty list instead of raising an error
-        return []
-    return history_list
+        return cached_json([], etag)
+    return cached_json(history_list, etag)
+
+
+@app.get("/search_history")
+def search_history(email: str, q: str, limit: int = 20, offset: int = 0):
+    """
+    Search a user's history by product name, ingredients or reasoning.
+    Results are ranked by relevance and paginated with limit and offset.
+    """
+    limit = max(1, min(limit, 100))
+    return db_manager.search_history(email, q, limit=limit, offset=max(0, offset))
+
+
+@app.get("/get_archived_history")
+def get_archived_history(email: str, start: str, end: str):
+    """
+    Retrieve history entries that have been moved to the archive, dated from
+    start (inclusive) to end (exclusive). The user's partition of every month
+    in the range is read, so the range may span at most ARCHIVE_QUERY_MAX_DAYS
+    days.
+    """
+    try:
+        # Stored dates are compared as strings, so forms such as 20250101
+        # are brought to the extended ISO format first.
+        start = datetime.fromisoformat(start).isoformat()
+        end = datetime.fromisoformat(end).isoformat()
+        span = datetime.fromisoformat(end) - datetime.fromisoformat(start)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="start and end must be ISO formatted dates.")
+    if span.total_seconds() <= 0 or span.days > ARCHIVE_QUERY_MAX_DAYS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"end must be after start and at most {ARCHIVE_QUERY_MAX_DAYS} days later.",
+        )
+    return history_archiver.query(email=email, start=start, end=end)
+
+
+@app.get("/export_history")
+def export_history_endpoint(
+    format: str = "ndjson",
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    since_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    commit_cursor: bool = False,
+    join_users: bool = False,
+    x_admin_token: Optional[str] = Header(None),
+):
+    """
+    Stream every user's history as NDJSON, an Arrow IPC stream or Parquet.
+    Pass cursor=<name> to receive only entries added since that consumer's
+    last committed export, and commit_cursor=true to move the cursor past
+    this export once it has been streamed in full. Requires the X-Admin-Token
+    header.
+    """
+    _require_admin(x_admin_token)
+    try:
+        chunks = export_history(
+            db_manager,
+            fmt=format,
+            start=start,
+            end=end,
+            since_id=since_id,
+            cursor=cursor,
+            commit_cursor=commit_cursor,
+            join_users=join_users,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return StreamingResponse(chunks, media_type=FORMATS[format])
 
 
 @app.get("/get_users")
@@ -215,11 +392,63 @@ def get_users():
     return users
 
 
+@app.get("/metrics")
+def get_metrics():
+    """
+    Report per-dependency upstream stats, admission queue depth and shed
+    counts, score cache hit rates, LLM input and cached token totals, and
+    how many request profiles are active and captured.
+    """
+    return {
+        "upstream": upstream.metrics(),
+        "admission": admission_controller.stats(),
+        "score_cache": score_cache.stats(),
+        "cohort_cache": cohort_cache.stats() if cohort_cache else None,
+        "llm_tokens": token_usage.stats(),
+        "profiling": profiler.stats(),
+    }
+
+
+def _require_admin(token: Optional[str]):
+    if not ADMIN_TOKEN or not token or not hmac.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="A valid X-Admin-Token header is required.")
+
+
+@app.get("/admin/profiles")
+def list_profiles(x_admin_token: Optional[str] = Header(None)):
+    """
+    List captured request profiles, newest first.
+    """
+    _require_admin(x_admin_token)
+    return profiler.summaries()
+
+
+@app.get("/admin/profiles/{profile_id}")
+def get_profile(profile_id: str, format: str = "json", x_admin_token: Optional[str] = Header(None)):
+    """
+    Download one request profile: its stage timings and top call stacks as
+    JSON, or with format=folded every sampled stack in the folded format
+    flame graph tools read.
+    """
+    _require_admin(x_admin_token)
+    profile = profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "folded":
+        return PlainTextResponse(
+            profile.folded(),
+            headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.folded"'},
+        )
+    return profile.to_dict()
+
+
 @app.post("/get_recommendations")
-def get_recommendations(request: RecommendationRequestModel):
+def get_recommendations(request: RecommendationRequestModel, if_none_match: Optional[str] = Header(None)):
     """
     Generate food recommendations for a user based on their past scans.
     Returns the top 3 healthiest foods for the user with explanations.
+    Recommendations only change with the user's profile and history, so a
+    client holding the current ETag gets a 304 without another LLM call.
     """
     try:
         # Get user information
@@ -228,19 +457,34 @@ def get_recommendations(request: RecommendationRequestModel):
             raise HTTPException(status_code=404, detail="User not found")
         
         # Get user history
-        history_items = db_manager.get_user_history(request.email)
+        with stage("history_lookup"):
+            history_items = db_manager.get_user_history(request.email)
         if not history_items or len(history_items) < 2:
             raise HTTPException(status_code=404, detail="Not enough history found to make recommendations. Please scan at least 2 items.")
         
         # Add product names and other missing data to history items
-        enriched_history = enrich_food_data(history_items)
+        with stage("enrich"):
+            enriched_history = enrich_food_data(history_items, db_manager)
+
+        # Names found by enrichment are written back and change the history
+        # version, so the ETag is only taken once they are stored.
+        etag = user_etag(db_manager, request.email, "recommendations")
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
         
         # Get recommendations
-        recommendations = get_food_recommendations(user_info, enriched_history)
+        with stage("llm_rank"):
+            recommendations = get_food_recommendations(user_info, enriched_history)
+
+        # Only tag the response if the history it was built from is still
+        # the version the ETag names.
+        if user_etag(db_manager, request.email, "recommendations") != etag:
+            etag = None
         
-        return {
-            "recommendations": recommendations.recommendations
-        }
+        return cached_json(
+            {"recommendations": [r.model_dump() for r in recommendations.recommendations]},
+            etag,
+        )
     except Exception as e:
         print(f"ERROR in get_recommendations: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error generating recommendations: {str(e)}")
@@ -0,0 +1,76 @@
+import asyncio
+import unittest
+
+from admission import AdmissionController, RoutePolicy, Shed
+from upstream import TokenBucket
+
+
+def make_controller(total_slots=1, max_queue=10):
+    return AdmissionController(
+        {
+            "/scan": RoutePolicy(priority=0, max_concurrent=10, max_wait=1.0),
+            "/recommend": RoutePolicy(priority=1, max_concurrent=10, max_wait=1.0),
+        },
+        total_slots=total_slots,
+        max_queue=max_queue,
+    )
+
+
+class TestAdmissionController(unittest.IsolatedAsyncioTestCase):
+    async def test_scans_are_admitted_before_recommendations(self):
+        controller = make_controller()
+        await controller.acquire("/scan")
+        order = []
+
+        async def request(route):
+            await controller.acquire(route)
+            order.append(route)
+            controller.release(route, 0.01)
+
+        recommend = asyncio.create_task(request("/recommend"))
+        await asyncio.sleep(0)
+        scan = asyncio.create_task(request("/scan"))
+        await asyncio.sleep(0)
+        controller.release("/scan", 0.01)
+        await asyncio.gather(recommend, scan)
+
+        self.assertEqual(order, ["/scan", "/recommend"])
+
+    async def test_full_queue_sheds_lower_priority(self):
+        controller = make_controller(max_queue=1)
+        await controller.acquire("/scan")
+        recommend = asyncio.create_task(controller.acquire("/recommend"))
+        await asyncio.sleep(0)
+        scan = asyncio.create_task(controller.acquire("/scan"))
+        await asyncio.sleep(0)
+
+        with self.assertRaises(Shed):
+            await recommend
+        self.assertEqual(controller.stats()["routes"]["/recommend"]["shed"], 1)
+
+        controller.release("/scan", 0.01)
+        await scan
+        self.assertEqual(controller.stats()["routes"]["/scan"]["admitted"], 2)
+
+    async def test_expected_wait_beyond_deadline_is_shed(self):
+        controller = make_controller()
+        controller.policies["/recommend"].service_time = 5.0
+        await controller.acquire("/scan")
+
+        with self.assertRaises(Shed) as shed:
+            await controller.acquire("/recommend")
+        self.assertEqual(shed.exception.reason, "deadline")
+        self.assertGreaterEqual(shed.exception.retry_after, 5.0)
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst_then_refill(self):
+        bucket = TokenBucket(rate=100, burst=2)
+        self.assertTrue(bucket.acquire())
+        self.assertTrue(bucket.acquire())
+        self.assertFalse(bucket.acquire())
+        self.assertTrue(bucket.acquire(timeout=0.1))
+
+
+if __name__ == "__main__":
+    unittest.main()
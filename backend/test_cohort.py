@@ -0,0 +1,82 @@
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from cohort import cohort_key, precompute, savings_report
+from database import DatabaseManager
+
+USER = {
+    "email": "a@example.com",
+    "height": 175.0,
+    "weight": 70.0,
+    "age": 31,
+    "physical_activity": "Regular exercise (3-4 times per week)",
+    "gender": "Male",
+    "comorbidities": ["Diabetes"],
+    "preferences": "Vegetarian, Low salt",
+}
+
+
+class TestCohortKey(unittest.TestCase):
+    def test_equivalent_profiles_share_a_key(self):
+        similar = dict(
+            USER,
+            email="b@example.com",
+            height=180.0,
+            weight=75.0,
+            age=38,
+            physical_activity="Moderate",
+            comorbidities=["diabetes"],
+            preferences="low salt and vegetarian",
+        )
+        self.assertEqual(cohort_key(USER), cohort_key(similar))
+
+    def test_different_bands_split_cohorts(self):
+        self.assertNotEqual(cohort_key(USER), cohort_key(dict(USER, age=45)))
+        self.assertNotEqual(cohort_key(USER), cohort_key(dict(USER, weight=100.0)))
+        self.assertNotEqual(cohort_key(USER), cohort_key(dict(USER, comorbidities=[])))
+
+    def test_missing_fields_do_not_raise(self):
+        self.assertIn("age=unknown", cohort_key({}))
+
+
+class TestCohortJobs(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_manager = DatabaseManager(os.path.join(self.tmp_dir.name, "test.db"))
+        for email in ["a@example.com", "b@example.com"]:
+            self.db_manager.add_user(**dict(USER, email=email))
+            for upc in ["111111111111", "222222222222"]:
+                self.db_manager.add_history(
+                    email=email, upc=upc, score=50, reasoning="", image_url=""
+                )
+
+    def tearDown(self):
+        self.db_manager.close()
+        self.tmp_dir.cleanup()
+
+    def test_precompute_scores_each_cohort_once(self):
+        calls = []
+
+        def score_batch(pairs):
+            calls.append(len(pairs))
+            return [SimpleNamespace(score=70, reasoning="Fine.") for _ in pairs]
+
+        stats = precompute(self.db_manager, score_batch, lambda upc: {"upc": upc})
+        self.assertEqual(stats["scored"], 2)
+        self.assertEqual(calls, [2])
+
+        stats = precompute(self.db_manager, score_batch, lambda upc: {"upc": upc})
+        self.assertEqual(stats["already_cached"], 2)
+        self.assertEqual(calls, [2])
+
+    def test_savings_report(self):
+        report = savings_report(self.db_manager, seconds_per_call=0.5)
+        self.assertEqual(report["per_user_calls"], 4)
+        self.assertEqual(report["cohort_calls"], 2)
+        self.assertEqual(report["seconds_saved"], 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,158 @@
+import os
+import tempfile
+import unittest
+
+from database import DatabaseManager
+
+
+class DatabaseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_manager = DatabaseManager(os.path.join(self.tmp_dir.name, "test.db"))
+        for email in ["jane.doe@example.com", "john@example.com"]:
+            self.add_user(email)
+
+    def tearDown(self):
+        self.db_manager.close()
+        self.tmp_dir.cleanup()
+
+    def add_user(self, email):
+        self.db_manager.add_user(
+            email=email,
+            height=175.0,
+            weight=70.0,
+            age=30,
+            physical_activity="Regular exercise",
+            gender="Female",
+            comorbidities=[],
+            preferences="Vegetarian",
+        )
+
+    def add_entry(self, email, upc, product_name, reasoning="", ingredients_text=None, date=None):
+        self.db_manager.add_history(
+            email=email,
+            upc=upc,
+            score=50,
+            reasoning=reasoning,
+            image_url="",
+            date=date,
+            product_name=product_name,
+            ingredients_text=ingredients_text,
+        )
+
+
+class TestSearchHistory(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.add_entry(
+            "jane.doe@example.com",
+            "049000031652",
+            "Coca-Cola Classic",
+            reasoning="High in added sugar.",
+            ingredients_text="Carbonated water, sugar, caramel color",
+        )
+        self.add_entry(
+            "jane.doe@example.com",
+            "016000275287",
+            "Cheerios",
+            reasoning="Whole grain oats with little sugar.",
+            ingredients_text="Whole grain oats, corn starch, sugar",
+        )
+        self.add_entry("john@example.com", "049000031652", "Coca-Cola Classic")
+
+    def search(self, email, query, **kwargs):
+        return [e["product_name"] for e in self.db_manager.search_history(email, query, **kwargs)]
+
+    def test_matches_name_reasoning_and_ingredients(self):
+        self.assertEqual(self.search("jane.doe@example.com", "coca cola"), ["Coca-Cola Classic"])
+        self.assertEqual(self.search("jane.doe@example.com", "oats"), ["Cheerios"])
+        self.assertEqual(self.search("jane.doe@example.com", "caramel"), ["Coca-Cola Classic"])
+
+    def test_last_word_matches_as_prefix(self):
+        self.assertEqual(self.search("jane.doe@example.com", "cheer"), ["Cheerios"])
+
+    def test_only_searches_own_history(self):
+        self.assertEqual(self.search("john@example.com", "cola"), ["Coca-Cola Classic"])
+        self.assertEqual(self.search("john@example.com", "cheerios"), [])
+        self.assertEqual(self.search("jane.doe@example.com", "example"), [])
+
+    def test_pagination(self):
+        self.assertEqual(len(self.search("jane.doe@example.com", "sugar")), 2)
+        self.assertEqual(len(self.search("jane.doe@example.com", "sugar", limit=1)), 1)
+        self.assertEqual(len(self.search("jane.doe@example.com", "sugar", limit=1, offset=1)), 1)
+
+    def test_index_follows_deletes(self):
+        ids = [e["id"] for e in self.db_manager.get_user_history("jane.doe@example.com")]
+        self.db_manager.delete_history(ids)
+        self.assertEqual(self.search("jane.doe@example.com", "sugar"), [])
+
+    def test_punctuation_only_query_returns_nothing(self):
+        self.assertEqual(self.search("jane.doe@example.com", '"*()'), [])
+
+    def test_single_letter_is_not_a_prefix(self):
+        self.assertEqual(self.search("jane.doe@example.com", "c"), [])
+        self.assertEqual(self.search("jane.doe@example.com", "ch"), ["Cheerios"])
+
+    def test_email_words_are_not_indexed(self):
+        self.assertEqual(self.search("jane.doe@example.com", "jane"), [])
+
+    def test_index_from_email_words_is_replaced(self):
+        # Recreate the index as earlier versions built it.
+        self.db_manager.conn.executescript(
+            """
+            DROP TABLE HistoryFTS;
+            CREATE VIRTUAL TABLE HistoryFTS USING fts5(
+                email, product_name, reasoning, ingredients_text,
+                content = 'History', content_rowid = 'id', tokenize = 'porter unicode61'
+            );
+            INSERT INTO HistoryFTS (HistoryFTS) VALUES ('rebuild');
+            """
+        )
+        path = self.db_manager.db_file
+        self.db_manager.close()
+        self.db_manager = DatabaseManager(path)
+        self.assertEqual(self.search("jane.doe@example.com", "cheer"), ["Cheerios"])
+        self.assertEqual(self.search("john@example.com", "cola"), ["Coca-Cola Classic"])
+
+
+class TestUserVersion(DatabaseTestCase):
+    def test_history_changes_bump_version(self):
+        email = "jane.doe@example.com"
+        profile_version, history_version = self.db_manager.get_user_version(email)
+
+        self.add_entry(email, "049000031652", "Coca-Cola Classic")
+        self.assertEqual(self.db_manager.get_user_version(email), (profile_version, history_version + 1))
+
+        entry_id = self.db_manager.get_user_history(email)[0]["id"]
+        self.db_manager.delete_history([entry_id])
+        self.assertEqual(self.db_manager.get_user_version(email), (profile_version, history_version + 2))
+
+    def test_other_users_are_unaffected(self):
+        before = self.db_manager.get_user_version("john@example.com")
+        self.add_entry("jane.doe@example.com", "049000031652", "Coca-Cola Classic")
+        self.assertEqual(self.db_manager.get_user_version("john@example.com"), before)
+
+    def test_profile_edit_bumps_profile_version(self):
+        self.db_manager.conn.execute(
+            "UPDATE Users SET weight = 68.0 WHERE email = ?;", ("john@example.com",)
+        )
+        self.assertEqual(self.db_manager.get_user_version("john@example.com"), (1, 0))
+
+    def test_unknown_user_has_no_version(self):
+        self.assertIsNone(self.db_manager.get_user_version("nobody@example.com"))
+
+
+class TestSetProductNames(DatabaseTestCase):
+    def test_fills_only_missing_names(self):
+        self.add_entry("jane.doe@example.com", "049000031652", None)
+        self.add_entry("john@example.com", "049000031652", "Unknown Product")
+        self.add_entry("john@example.com", "049000031652", "Coke")
+
+        self.db_manager.set_product_names({"049000031652": "Coca-Cola Classic"})
+
+        names = sorted(e["product_name"] for e in self.db_manager.get_all_history())
+        self.assertEqual(names, ["Coca-Cola Classic", "Coca-Cola Classic", "Coke"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import io
+import json
+import unittest
+
+from export import export_history, pa
+from test_database import DatabaseTestCase
+
+
+class TestExportHistory(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.add_entry("jane.doe@example.com", "049000031652", "Coca-Cola", date="2025-01-10T10:00:00")
+        self.add_entry("john@example.com", "016000275287", "Cheerios", date="2025-02-10T10:00:00")
+        self.add_entry("jane.doe@example.com", "016000275287", "Cheerios", date="2025-03-10T10:00:00")
+
+    def export_ndjson(self, **kwargs):
+        data = b"".join(export_history(self.db_manager, batch_size=2, **kwargs))
+        return [json.loads(line) for line in data.decode("utf-8").splitlines()]
+
+    def test_ndjson_streams_every_entry(self):
+        rows = self.export_ndjson()
+        self.assertEqual([row["id"] for row in rows], [1, 2, 3])
+
+    def test_date_range_and_user_join(self):
+        rows = self.export_ndjson(start="2025-02-01", end="2025-03-01", join_users=True)
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["email"], "john@example.com")
+        self.assertEqual(rows[0]["comorbidities"], [])
+        self.assertEqual(rows[0]["age"], 30)
+
+    def test_cursor_exports_only_new_entries(self):
+        self.assertEqual(len(self.export_ndjson(cursor="analytics", commit_cursor=True)), 3)
+        self.assertEqual(self.export_ndjson(cursor="analytics", commit_cursor=True), [])
+
+        self.add_entry("john@example.com", "049000031652", "Coca-Cola")
+        rows = self.export_ndjson(cursor="analytics", commit_cursor=True)
+        self.assertEqual([row["id"] for row in rows], [4])
+
+    def test_reading_does_not_advance_cursor(self):
+        self.assertEqual(len(self.export_ndjson(cursor="analytics")), 3)
+        self.assertEqual(len(self.export_ndjson(cursor="analytics")), 3)
+        with self.assertRaises(ValueError):
+            export_history(self.db_manager, commit_cursor=True)
+
+    def test_unknown_format_is_rejected_before_streaming(self):
+        with self.assertRaises(ValueError):
+            export_history(self.db_manager, fmt="csv")
+
+    @unittest.skipIf(pa is None, "pyarrow is not installed")
+    def test_parquet_and_arrow(self):
+        import pyarrow.parquet as pq
+
+        data = b"".join(export_history(self.db_manager, fmt="parquet", batch_size=2, join_users=True))
+        table = pq.read_table(io.BytesIO(data))
+        self.assertEqual(table.num_rows, 3)
+        self.assertEqual(pq.ParquetFile(io.BytesIO(data)).num_row_groups, 2)
+
+        data = b"".join(export_history(self.db_manager, fmt="arrow", batch_size=2))
+        self.assertEqual(pa.ipc.open_stream(data).read_all().num_rows, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from database import DatabaseManager
+from gtin import InvalidGTIN, canonicalize, expand_upce
+from test_database import DatabaseTestCase
+
+
+class TestCanonicalize(unittest.TestCase):
+    def test_upc_a_ean_13_and_gtin_14_agree(self):
+        for code in ["049000031652", "0049000031652", "00049000031652", " 049000-031652\n"]:
+            self.assertEqual(canonicalize(code), "0049000031652")
+
+    def test_upc_e_is_expanded(self):
+        self.assertEqual(expand_upce("04252614"), "042100005264")
+        self.assertEqual(canonicalize("04252614"), "0042100005264")
+
+    def test_ean_8_is_kept(self):
+        self.assertEqual(canonicalize("96385074"), "96385074")
+
+    def test_case_gtin_14_is_kept(self):
+        self.assertEqual(canonicalize("10049000031659"), "10049000031659")
+
+    def test_bad_check_digit(self):
+        with self.assertRaises(InvalidGTIN):
+            canonicalize("049000031653", strict=True)
+        self.assertEqual(canonicalize("049000031653"), "049000031653")
+
+    def test_bad_length_and_characters(self):
+        for code in ["12345", "04900003165A", ""]:
+            with self.assertRaises(InvalidGTIN):
+                canonicalize(code, strict=True)
+
+
+class TestAddHistory(DatabaseTestCase):
+    def test_stores_canonical_upc(self):
+        self.add_entry("jane.doe@example.com", "049000031652", "Coca-Cola Classic")
+        self.add_entry("jane.doe@example.com", "not-a-upc", "Unknown Product")
+        upcs = {e["upc"] for e in self.db_manager.get_user_history("jane.doe@example.com")}
+        self.assertEqual(upcs, {"0049000031652", "not-a-upc"})
+
+
+class TestMigration(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_file = os.path.join(self.tmp_dir.name, "test.db")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_migration_canonicalizes_existing_rows(self):
+        conn = sqlite3.connect(self.db_file)
+        conn.execute("CREATE TABLE History (id INTEGER PRIMARY KEY AUTOINCREMENT, email TEXT, upc TEXT, score INTEGER, reasoning TEXT, image_url TEXT, date TEXT, product_name TEXT);")
+        conn.executemany(
+            "INSERT INTO History (email, upc) VALUES (?, ?);",
+            [("jane.doe@example.com", "049000031652"), ("jane.doe@example.com", "0049000031652 ")],
+        )
+        conn.commit()
+        conn.close()
+
+        db_manager = DatabaseManager(self.db_file)
+        upcs = [row[0] for row in db_manager.conn.execute("SELECT upc FROM History;")]
+        self.assertEqual(upcs, ["0049000031652", "0049000031652"])
+        self.assertEqual(db_manager.conn.execute("PRAGMA user_version;").fetchone()[0], 1)
+        db_manager.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
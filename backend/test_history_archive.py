@@ -0,0 +1,126 @@
+import gzip
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+from database import DatabaseManager
+from history_archive import HistoryArchiver
+
+
+class TestHistoryArchiver(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_manager = DatabaseManager(os.path.join(self.tmp_dir.name, "test.db"))
+        self.db_manager.add_user(
+            email="test@example.com",
+            height=175.0,
+            weight=70.0,
+            age=30,
+            physical_activity="Regular exercise",
+            gender="Male",
+            comorbidities=[],
+            preferences="Vegetarian",
+        )
+        self.archiver = HistoryArchiver(
+            self.db_manager,
+            archive_dir=os.path.join(self.tmp_dir.name, "archive"),
+            max_age_days=30,
+        )
+
+    def tearDown(self):
+        self.db_manager.close()
+        self.tmp_dir.cleanup()
+
+    def add_entry(self, upc, date):
+        self.db_manager.add_history(
+            email="test@example.com",
+            upc=upc,
+            score=80,
+            reasoning="Some reasoning",
+            image_url="https://example.com/product.jpg",
+            date=date,
+        )
+
+    def test_archive_moves_old_entries(self):
+        self.add_entry("111111111111", "2025-01-15T10:00:00")
+        self.add_entry("222222222222", "2025-02-20T10:00:00")
+        self.add_entry("333333333333", "2025-06-01T10:00:00")
+
+        result = self.archiver.archive(now=datetime(2025, 6, 10))
+
+        self.assertEqual(result["archived"], 2)
+        self.assertEqual(len(self.archiver.partitions()), 2)
+        hot_upcs = [e["upc"] for e in self.db_manager.get_user_history("test@example.com")]
+        self.assertEqual(hot_upcs, ["333333333333"])
+
+    def test_query_filters_archived_entries(self):
+        self.add_entry("111111111111", "2025-01-15T10:00:00")
+        self.add_entry("222222222222", "2025-02-20T10:00:00")
+        self.archiver.archive(now=datetime(2025, 6, 10))
+
+        all_entries = self.archiver.query(email="test@example.com")
+        self.assertEqual([e["upc"] for e in all_entries], ["222222222222", "111111111111"])
+
+        february = self.archiver.query(
+            email="test@example.com", start="2025-02-01", end="2025-03-01"
+        )
+        self.assertEqual([e["upc"] for e in february], ["222222222222"])
+        self.assertEqual(self.archiver.query(email="other@example.com"), [])
+
+    def test_archive_appends_to_existing_partition(self):
+        self.add_entry("111111111111", "2025-01-15T10:00:00")
+        self.archiver.archive(now=datetime(2025, 6, 10))
+        self.add_entry("222222222222", "2025-01-16T10:00:00")
+        self.archiver.archive(now=datetime(2025, 6, 10))
+
+        self.assertEqual(len(self.archiver.partitions()), 1)
+        self.assertEqual(len(self.archiver.query()), 2)
+
+    def test_query_for_a_user_opens_only_their_bucket(self):
+        self.db_manager.add_user("john@example.com", 160.0, 60.0, 40, "None", "Female", [], "")
+        self.add_entry("111111111111", "2025-01-15T10:00:00")
+        self.db_manager.add_history("john@example.com", "222222222222", 50, "", "", date="2025-01-16T10:00:00")
+        # The two users hash to different buckets out of two.
+        archiver = HistoryArchiver(self.db_manager, archive_dir=self.archiver.archive_dir, max_age_days=30, buckets=2)
+        archiver.archive(now=datetime(2025, 6, 10))
+        self.assertEqual(len(archiver.partitions()), 2)
+
+        with patch("history_archive.gzip.open", wraps=gzip.open) as opened:
+            entries = archiver.query(email="test@example.com", start="2025-01-01", end="2025-02-01")
+        self.assertEqual([e["upc"] for e in entries], ["111111111111"])
+        self.assertEqual(opened.call_count, 1)
+
+    def test_undated_partition_is_skipped_for_ranges(self):
+        # Rows whose date could not be parsed end up in the undated partition.
+        self.add_entry("111111111111", "2025-01-15T10:00:00")
+        self.db_manager.conn.execute("UPDATE History SET date = '';")
+        self.db_manager.conn.commit()
+        self.archiver.archive(now=datetime(2025, 6, 10))
+
+        self.assertEqual(len(self.archiver.query()), 1)
+        with patch("history_archive.gzip.open", side_effect=AssertionError("partition opened")):
+            self.assertEqual(self.archiver.query(start="2025-01-01", end="2025-02-01"), [])
+
+    def test_existing_database_is_converted_on_request(self):
+        path = os.path.join(self.tmp_dir.name, "legacy.db")
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE Legacy (id INTEGER);")
+        conn.commit()
+        conn.close()
+
+        db_manager = DatabaseManager(path)
+        try:
+            self.assertEqual(db_manager.conn.execute("PRAGMA auto_vacuum;").fetchone()[0], 0)
+            self.assertEqual(db_manager.enable_incremental_vacuum(), 1)
+            self.assertEqual(db_manager.conn.execute("PRAGMA auto_vacuum;").fetchone()[0], 2)
+            self.assertEqual(db_manager.enable_incremental_vacuum(), 0)
+        finally:
+            db_manager.close()
+        self.assertEqual(self.db_manager.conn.execute("PRAGMA auto_vacuum;").fetchone()[0], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import threading
+import unittest
+
+from llm_batcher import ScoringBatcher
+
+
+class TestScoringBatcher(unittest.TestCase):
+    def test_concurrent_requests_share_one_call(self):
+        calls = []
+
+        def score_batch(pairs):
+            calls.append(len(pairs))
+            return [food_info["upc"] for _, food_info in pairs]
+
+        batcher = ScoringBatcher(score_batch, window=0.2, max_batch_size=4)
+        results = {}
+
+        def caller(upc):
+            results[upc] = batcher.score({}, {"upc": upc}, timeout=5)
+
+        threads = [threading.Thread(target=caller, args=(str(i),)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(calls, [4])
+        self.assertEqual(results, {str(i): str(i) for i in range(4)})
+
+    def test_batch_errors_reach_every_caller(self):
+        def score_batch(pairs):
+            raise RuntimeError("model unavailable")
+
+        batcher = ScoringBatcher(score_batch, window=0.01, max_batch_size=4)
+        with self.assertRaises(RuntimeError):
+            batcher.score({}, {}, timeout=5)
+
+    def test_zero_window_scores_directly(self):
+        calls = []
+
+        def score_batch(pairs):
+            calls.append(threading.current_thread())
+            return ["ok"]
+
+        batcher = ScoringBatcher(score_batch, window=0)
+        self.assertEqual(batcher.score({}, {}), "ok")
+        self.assertEqual(calls, [threading.current_thread()])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+from unittest.mock import patch
+
+from product_resolver import ProductNotFoundError, resolve_product
+
+OFF_PRODUCT = {
+    "product_name": "Guava Juice",
+    "image_front_url": "https://images.openfoodfacts.org/guava.jpg",
+    "ingredients_text": "Guava puree, water",
+    "nutriscore_score": 3,
+    "nutriscore_grade": "c",
+    "nova_group": 3,
+    "allergens": "",
+}
+
+
+class TestResolveProduct(unittest.TestCase):
+    @patch("product_resolver.scrape_product_details")
+    @patch("product_resolver.get_product_info")
+    def test_off_image_skips_scraping(self, mock_get_product_info, mock_scrape):
+        mock_get_product_info.return_value = OFF_PRODUCT
+
+        record = resolve_product("850017142466")
+
+        self.assertEqual(record.product_name, "Guava Juice")
+        self.assertEqual(record.image_url, OFF_PRODUCT["image_front_url"])
+        self.assertEqual(record.image_source, "open_food_facts")
+        mock_scrape.assert_not_called()
+
+    @patch("product_resolver.scrape_product_details")
+    @patch("product_resolver.get_product_info")
+    def test_scrapes_when_off_has_no_image(self, mock_get_product_info, mock_scrape):
+        mock_get_product_info.return_value = dict(OFF_PRODUCT, image_front_url=None, product_name="")
+        mock_scrape.return_value = {"name": "Scraped Juice", "image": "https://go-upc.com/juice.jpg"}
+
+        record = resolve_product("850017142466")
+
+        self.assertEqual(record.product_name, "Scraped Juice")
+        self.assertEqual(record.image_url, "https://go-upc.com/juice.jpg")
+        self.assertEqual(record.image_source, "go_upc")
+
+    @patch("product_resolver.scrape_product_details")
+    @patch("product_resolver.get_product_info")
+    def test_scrape_failure_leaves_image_empty(self, mock_get_product_info, mock_scrape):
+        mock_get_product_info.return_value = dict(OFF_PRODUCT, image_front_url=None)
+        mock_scrape.side_effect = Exception("Go-UPC down")
+
+        record = resolve_product("850017142466")
+
+        self.assertIsNone(record.image_url)
+        self.assertEqual(record.product_name, "Guava Juice")
+
+    @patch("product_resolver.get_product_info")
+    def test_unknown_product_raises(self, mock_get_product_info):
+        mock_get_product_info.return_value = None
+        with self.assertRaises(ProductNotFoundError):
+            resolve_product("000000000000")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import time
+import unittest
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from profiling import Profiler, ProfilingMiddleware, stage
+
+
+def slow_lookup(seconds):
+    time.sleep(seconds)
+
+
+def make_client(profiler):
+    app = FastAPI()
+    app.add_middleware(ProfilingMiddleware, profiler=profiler, admin_token="secret")
+
+    @app.get("/scan")
+    def scan(delay: float = 0.0):
+        with stage("lookup"):
+            slow_lookup(delay)
+        return {"ok": True}
+
+    return TestClient(app)
+
+
+class TestProfiler(unittest.TestCase):
+    def test_fast_unsampled_requests_are_not_kept(self):
+        profiler = Profiler(slow_threshold=1.0)
+        response = make_client(profiler).get("/scan")
+        self.assertNotIn("X-Profile-Id", response.headers)
+        self.assertEqual(profiler.summaries(), [])
+
+    def test_debug_header_samples_request(self):
+        profiler = Profiler(slow_threshold=10.0, interval=0.001)
+        response = make_client(profiler).get(
+            "/scan?delay=0.1", headers={"X-Debug-Profile": "1", "X-Admin-Token": "secret"}
+        )
+
+        profile = profiler.get(response.headers["X-Profile-Id"])
+        self.assertEqual(profile.status, 200)
+        self.assertEqual([s["name"] for s in profile.stages], ["lookup"])
+        self.assertGreaterEqual(profile.stages[0]["duration_ms"], 100)
+        self.assertGreater(profile.samples, 0)
+        self.assertIn("test_profiling.py:slow_lookup", profile.folded())
+
+    def test_debug_header_needs_admin_token(self):
+        profiler = Profiler(slow_threshold=10.0)
+        client = make_client(profiler)
+        for headers in [{"X-Debug-Profile": "1"}, {"X-Debug-Profile": "1", "X-Admin-Token": "wrong"}]:
+            response = client.get("/scan", headers=headers)
+            self.assertNotIn("X-Profile-Id", response.headers)
+        self.assertEqual(profiler.summaries(), [])
+
+    def test_slow_request_is_captured_with_stacks(self):
+        profiler = Profiler(slow_threshold=0.1, interval=0.001)
+        make_client(profiler).get("/scan?delay=0.2")
+
+        [summary] = profiler.summaries()
+        self.assertFalse(summary["sampled"])
+        self.assertGreater(summary["samples"], 0)
+        self.assertIn("slow_lookup", profiler.get(summary["id"]).folded())
+
+    def test_ring_buffer_is_bounded(self):
+        profiler = Profiler(sample_rate=1.0, buffer_size=2)
+        client = make_client(profiler)
+        ids = [client.get("/scan").headers["X-Profile-Id"] for _ in range(3)]
+        self.assertEqual([p["id"] for p in profiler.summaries()], ids[:0:-1])
+
+    def test_stage_outside_request_is_a_no_op(self):
+        with stage("lookup"):
+            pass
+
+
+if __name__ == "__main__":
+    unittest.main()
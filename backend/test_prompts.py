@@ -0,0 +1,73 @@
+import unittest
+
+from langchain_core.messages import AIMessage
+
+from prompts import TokenUsage, batch_scoring_messages, ranking_messages, scoring_messages
+
+USER = {
+    "email": "jane.doe@example.com",
+    "height": 165.0,
+    "weight": 60.0,
+    "age": 28,
+    "physical_activity": "Regular exercise",
+    "gender": "Female",
+    "comorbidities": ["asthma"],
+    "preferences": "Vegetarian",
+}
+COLA = {"ingredients_text": "Carbonated water, sugar", "nutriscore_grade": "e"}
+OATS = {"ingredients_text": "Whole grain oats", "nutriscore_grade": "a"}
+
+
+def prompt_text(messages):
+    return "".join(message.content for message in messages)
+
+
+class TestPromptLayout(unittest.TestCase):
+    def test_email_is_left_out(self):
+        for messages in (
+            scoring_messages(USER, COLA),
+            batch_scoring_messages([(USER, COLA), (USER, OATS)]),
+            ranking_messages(USER, "Food: Cola"),
+        ):
+            self.assertNotIn(USER["email"], prompt_text(messages))
+
+    def test_scans_share_instructions_and_profile_prefix(self):
+        cola = prompt_text(scoring_messages(USER, COLA))
+        oats = prompt_text(scoring_messages(USER, OATS))
+        prefix_end = cola.index("Here is information about the food:")
+        self.assertEqual(cola[:prefix_end], oats[:prefix_end])
+        self.assertIn("Comorbidities: asthma", cola[:prefix_end])
+
+    def test_instructions_do_not_depend_on_request(self):
+        other_user = dict(USER, age=61, email="john@example.com")
+        self.assertEqual(
+            scoring_messages(USER, COLA)[0].content, scoring_messages(other_user, OATS)[0].content
+        )
+
+
+class TestTokenUsage(unittest.TestCase):
+    def test_records_input_and_cached_tokens(self):
+        usage = TokenUsage()
+        message = AIMessage(
+            "",
+            usage_metadata={
+                "input_tokens": 1200,
+                "output_tokens": 50,
+                "total_tokens": 1250,
+                "input_token_details": {"cache_read": 1024},
+            },
+        )
+        self.assertEqual(
+            usage.record("openai", message),
+            {"input_tokens": 1200, "cached_tokens": 1024, "output_tokens": 50},
+        )
+        usage.record("openai", AIMessage(""))
+
+        stats = usage.stats()["openai"]
+        self.assertEqual(stats["calls"], 2)
+        self.assertEqual(stats["cached_tokens"], 1024)
+        self.assertAlmostEqual(stats["cache_hit_rate"], 0.853)
+
+
+if __name__ == "__main__":
+    unittest.main()
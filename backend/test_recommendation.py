@@ -1,3 +1,4 @@
+import threading
 import unittest
 from recommendation import get_food_recommendations, enrich_food_data
 from unittest.mock import patch, MagicMock
@@ -60,8 +61,39 @@ class TestRecommendation(unittest.TestCase):
         self.assertEqual(enriched_items[0]["name"], "Mocked Product")
         mock_get_product_info.assert_called_once_with("123456789012")
     
-    @patch('recommendation.structured_model.invoke')
-    def test_get_food_recommendations(self, mock_invoke):
+    @patch('recommendation.get_product_info')
+    def test_enrich_food_data_dedupes_and_skips_named_items(self, mock_get_product_info):
+        mock_get_product_info.return_value = {"product_name": "Mocked Product"}
+        history_items = [
+            {"upc": "123456789012", "product_name": None},
+            {"upc": "123456789012", "product_name": "Unknown Product"},
+            {"upc": "987654321098", "product_name": "Greek Yogurt"},
+        ]
+        db_manager = MagicMock()
+
+        enriched_items = enrich_food_data(history_items, db_manager)
+
+        mock_get_product_info.assert_called_once_with("123456789012")
+        self.assertEqual([item["product_name"] for item in enriched_items], ["Mocked Product", "Mocked Product", "Greek Yogurt"])
+        db_manager.set_product_names.assert_called_once_with({"123456789012": "Mocked Product"})
+
+    @patch('recommendation.ENRICH_DEADLINE', 0.05)
+    @patch('recommendation.get_product_info')
+    def test_enrich_food_data_falls_back_when_lookup_is_slow(self, mock_get_product_info):
+        release = threading.Event()
+        mock_get_product_info.side_effect = lambda upc: release.wait(1) and {"product_name": "Too Late"}
+        db_manager = MagicMock()
+
+        try:
+            enriched_items = enrich_food_data([{"upc": "123456789012"}], db_manager)
+        finally:
+            release.set()
+
+        self.assertEqual(enriched_items[0]["name"], "Unknown Product")
+        db_manager.set_product_names.assert_not_called()
+
+    @patch('recommendation.structured_model')
+    def test_get_food_recommendations(self, mock_structured_model):
         # Mock the LLM response
         mock_recommendations = MagicMock()
         mock_recommendations.recommendations = [
@@ -73,7 +105,8 @@ class TestRecommendation(unittest.TestCase):
                 upc="123456789012"
             )
         ]
-        mock_invoke.return_value = mock_recommendations
+        mock_invoke = mock_structured_model.invoke
+        mock_invoke.return_value = {"raw": MagicMock(usage_metadata=None), "parsed": mock_recommendations, "parsing_error": None}
         
         # Sample user info
         user_info = {
@@ -100,8 +133,9 @@ class TestRecommendation(unittest.TestCase):
         
         result = get_food_recommendations(user_info, history_items)
         
-        # Check that the LLM was called
+        # Check that the LLM was called without the email in the prompt
         mock_invoke.assert_called_once()
+        self.assertNotIn("test@example.com", str(mock_invoke.call_args))
         
         # Check that the result has the right structure
         self.assertEqual(len(result.recommendations), 1)
@@ -0,0 +1,119 @@
+import os
+import tempfile
+import unittest
+from operator import itemgetter
+
+from database import DatabaseManager, shard_file
+from export import export_history
+from reshard import reshard
+
+EMAILS = [f"user{i}@example.com" for i in range(12)]
+
+
+class ShardedTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_file = os.path.join(self.tmp_dir.name, "test.db")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def populate(self, db_manager):
+        for email in EMAILS:
+            db_manager.add_user(email, 175.0, 70.0, 30, "Regular exercise", "Female", [], "Vegetarian")
+            db_manager.add_history(email, "049000031652", 50, "", "", product_name="Coca-Cola")
+            db_manager.add_history(email, "016000275287", 80, "", "", product_name="Cheerios")
+
+
+class TestShardedDatabase(ShardedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.db_manager = DatabaseManager(self.db_file, shards=4)
+        self.populate(self.db_manager)
+
+    def tearDown(self):
+        self.db_manager.close()
+        super().tearDown()
+
+    def test_users_are_spread_over_shard_files(self):
+        for index in range(4):
+            self.assertTrue(os.path.exists(shard_file(self.db_file, index, 4)))
+        used = {self.db_manager.shard_index(email) for email in EMAILS}
+        self.assertGreater(len(used), 1)
+        self.assertEqual(self.db_manager.conn.execute("SELECT COUNT(*) FROM Users;").fetchone()[0], 0)
+
+    def test_routed_reads_and_fan_out(self):
+        self.assertEqual(len(self.db_manager.get_user_history(EMAILS[0])), 2)
+        self.assertEqual(self.db_manager.search_history(EMAILS[0], "cheerios")[0]["upc"], "0016000275287")
+        self.assertEqual(len(self.db_manager.get_users()), len(EMAILS))
+        self.assertEqual(len(self.db_manager.get_all_history()), 2 * len(EMAILS))
+        self.assertEqual(
+            sorted(self.db_manager.get_upc_scan_counts(2)),
+            [("0016000275287", len(EMAILS)), ("0049000031652", len(EMAILS))],
+        )
+
+    def test_ids_are_unique_across_shards(self):
+        ids = [entry["id"] for entry in self.db_manager.get_all_history()]
+        self.assertEqual(len(set(ids)), len(ids))
+
+        self.db_manager.delete_history(ids[:3])
+        self.assertEqual(len(self.db_manager.get_all_history()), len(ids) - 3)
+
+    def test_export_cursor_tracks_each_shard(self):
+        def export():
+            return b"".join(export_history(self.db_manager, cursor="analytics", commit_cursor=True))
+
+        self.assertEqual(len(export().splitlines()), 24)
+        self.assertEqual(export(), b"")
+
+        # An entry in the shard with the lowest ids is still picked up.
+        entries = self.db_manager.get_all_history()
+        oldest_email = min(entries, key=itemgetter("id"))["email"]
+        self.db_manager.add_history(oldest_email, "049000031652", 50, "", "")
+        self.assertEqual(len(export().splitlines()), 1)
+
+
+class TestReshard(ShardedTestCase):
+    def test_round_trip_keeps_data_and_ids(self):
+        db_manager = DatabaseManager(self.db_file, shards=1)
+        self.populate(db_manager)
+        before = {entry["id"]: entry["upc"] for entry in db_manager.get_all_history()}
+        db_manager.close()
+
+        self.assertEqual(reshard(self.db_file, 1, 3), (len(EMAILS), len(before)))
+        db_manager = DatabaseManager(self.db_file, shards=3)
+        self.assertEqual({e["id"]: e["upc"] for e in db_manager.get_all_history()}, before)
+        db_manager.add_history(EMAILS[0], "049000031652", 50, "", "")
+        self.assertGreater(db_manager.get_user_history(EMAILS[0])[0]["id"], max(before))
+        db_manager.close()
+
+        reshard(self.db_file, 3, 1)
+        self.assertFalse(os.path.exists(shard_file(self.db_file, 0, 3)))
+        db_manager = DatabaseManager(self.db_file, shards=1)
+        self.assertEqual(len(db_manager.get_all_history()), len(before) + 1)
+        self.assertEqual(len(db_manager.get_users()), len(EMAILS))
+        db_manager.close()
+
+    def test_refuses_to_overwrite(self):
+        for shards in (1, 2):
+            db_manager = DatabaseManager(self.db_file, shards=shards, check_layout=False)
+            self.populate(db_manager)
+            db_manager.close()
+        with self.assertRaises(ValueError):
+            reshard(self.db_file, 1, 2)
+
+    def test_mismatched_layout_is_refused(self):
+        db_manager = DatabaseManager(self.db_file, shards=1)
+        self.populate(db_manager)
+        db_manager.close()
+        with self.assertRaisesRegex(RuntimeError, "reshard.py move --db .* --from 1 --to 2"):
+            DatabaseManager(self.db_file, shards=2)
+
+        reshard(self.db_file, 1, 2)
+        with self.assertRaisesRegex(RuntimeError, "--from 2 --to 1"):
+            DatabaseManager(self.db_file, shards=1)
+        DatabaseManager(self.db_file, shards=2).close()
+
+
+if __name__ == "__main__":
+    unittest.main()
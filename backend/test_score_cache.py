@@ -0,0 +1,92 @@
+import os
+import tempfile
+import unittest
+
+from database import DatabaseManager
+from score_cache import ScoreCache, food_fingerprint, profile_hash, replay_report
+
+USER = {
+    "email": "test@example.com",
+    "height": 175.0,
+    "weight": 70.0,
+    "age": 30,
+    "physical_activity": "Regular exercise",
+    "gender": "Male",
+    "comorbidities": ["Diabetes", "asthma"],
+    "preferences": "Vegetarian",
+}
+
+FOOD = {
+    "ingredients_text": "Water, Sugar, Citric Acid.",
+    "nutriscore_score": 14,
+    "nutriscore_grade": "d",
+    "nova_group": 4,
+    "allergens": "en:milk,en:soybeans",
+}
+
+
+class TestFingerprints(unittest.TestCase):
+    def test_fingerprint_ignores_formatting(self):
+        same_food = dict(
+            FOOD,
+            ingredients_text="  water,  sugar, citric acid ",
+            nutriscore_grade="D",
+            allergens="en:soybeans, en:milk",
+        )
+        self.assertEqual(food_fingerprint(FOOD), food_fingerprint(same_food))
+
+    def test_fingerprint_changes_with_content(self):
+        other_food = dict(FOOD, ingredients_text="Water, Sugar")
+        self.assertNotEqual(food_fingerprint(FOOD), food_fingerprint(other_food))
+
+    def test_no_fingerprint_without_ingredients(self):
+        self.assertIsNone(food_fingerprint(dict(FOOD, ingredients_text="")))
+        self.assertIsNone(food_fingerprint(None))
+
+    def test_profile_hash_ignores_email(self):
+        other_user = dict(USER, email="other@example.com", comorbidities=["asthma", "diabetes"])
+        self.assertEqual(profile_hash(USER), profile_hash(other_user))
+        self.assertNotEqual(profile_hash(USER), profile_hash(dict(USER, age=31)))
+
+
+class TestScoreCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_manager = DatabaseManager(os.path.join(self.tmp_dir.name, "test.db"))
+
+    def tearDown(self):
+        self.db_manager.close()
+        self.tmp_dir.cleanup()
+
+    def test_lookup_reuses_score_for_matching_content(self):
+        cache = ScoreCache(self.db_manager)
+        self.assertIsNone(cache.lookup(USER, FOOD))
+        cache.store(USER, FOOD, 40, "Sugary drink.")
+
+        cached = cache.lookup(USER, dict(FOOD, ingredients_text="water, sugar, citric acid"))
+        self.assertEqual(cached["score"], 40)
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_replay_report_counts_fingerprint_hits(self):
+        self.db_manager.add_user(**USER)
+        for i, upc in enumerate(["111111111111", "222222222222", "111111111111"]):
+            self.db_manager.add_history(
+                email=USER["email"],
+                upc=upc,
+                score=40,
+                reasoning="Sugary drink.",
+                image_url="",
+                date=f"2025-01-0{i + 1}T10:00:00",
+            )
+
+        report = replay_report(self.db_manager, lambda upc: FOOD)
+
+        self.assertEqual(report["scans"], 3)
+        self.assertAlmostEqual(report["upc_hit_rate"], 1 / 3)
+        self.assertAlmostEqual(report["fingerprint_hit_rate"], 2 / 3)
+        self.assertAlmostEqual(report["extra_hit_rate"], 1 / 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+# Importing server opens its database; keep it off the tracked example.db.
+_import_dir = tempfile.TemporaryDirectory()
+os.environ["DB_FILE"] = os.path.join(_import_dir.name, "server.db")
+
+import server  # noqa: E402
+from database import DatabaseManager  # noqa: E402
+from history_archive import HistoryArchiver  # noqa: E402
+from recommendation import FoodRecommendation, RecommendationResult  # noqa: E402
+
+
+class ServerTestCase(unittest.TestCase):
+    """Run the app against a fresh database and archive for each test."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_manager = DatabaseManager(os.path.join(self.tmp_dir.name, "test.db"))
+        self.archiver = HistoryArchiver(self.db_manager, archive_dir=os.path.join(self.tmp_dir.name, "archive"))
+        for name, value in [("db_manager", self.db_manager), ("history_archiver", self.archiver)]:
+            patcher = patch.object(server, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = TestClient(server.app)
+
+    def tearDown(self):
+        self.db_manager.close()
+        self.tmp_dir.cleanup()
+
+
+class TestRecommendationRevalidation(ServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.db_manager.add_user("jane.doe@example.com", 175.0, 70.0, 30, "Regular exercise", "Female", [], "")
+        for upc in ["0049000031652", "0012000001086"]:
+            # Entries without a name are resolved and written back on the
+            # first request.
+            self.db_manager.add_history("jane.doe@example.com", upc, 50, "", "", product_name=None)
+
+    @patch("server.get_food_recommendations")
+    @patch("recommendation.get_product_info")
+    def test_second_poll_is_not_modified(self, mock_get_product_info, mock_get_recommendations):
+        mock_get_product_info.return_value = {"product_name": "Resolved Product"}
+        mock_get_recommendations.return_value = RecommendationResult(
+            recommendations=[
+                FoodRecommendation(
+                    food_name="Resolved Product", image_url="", upc="0049000031652", score=80, reasoning="Fine."
+                )
+            ]
+        )
+
+        first = self.client.post("/get_recommendations", json={"email": "jane.doe@example.com"})
+        self.assertEqual(first.status_code, 200)
+        self.assertIn("ETag", first.headers)
+        names = {entry["product_name"] for entry in self.db_manager.get_user_history("jane.doe@example.com")}
+        self.assertEqual(names, {"Resolved Product"})
+
+        second = self.client.post(
+            "/get_recommendations",
+            json={"email": "jane.doe@example.com"},
+            headers={"If-None-Match": first.headers["ETag"]},
+        )
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(mock_get_recommendations.call_count, 1)
+
+    def test_name_backfill_changes_history_etag(self):
+        url = "/get_history?email=jane.doe@example.com"
+        first = self.client.get(url)
+        self.db_manager.set_product_names({"0049000031652": "Coke"})
+
+        second = self.client.get(url, headers={"If-None-Match": first.headers["ETag"]})
+        self.assertEqual(second.status_code, 200)
+        self.assertIn("Coke", [entry["product_name"] for entry in second.json()])
+
+
+class TestExportHistoryEndpoint(ServerTestCase):
+    def test_requires_admin_token(self):
+        with patch.object(server, "ADMIN_TOKEN", "secret"):
+            self.assertEqual(self.client.get("/export_history").status_code, 403)
+            response = self.client.get("/export_history", headers={"X-Admin-Token": "secret"})
+        self.assertEqual(response.status_code, 200)
+
+
+class TestArchivedHistoryEndpoint(ServerTestCase):
+    def test_requires_bounded_date_range(self):
+        url = "/get_archived_history?email=jane.doe@example.com"
+        self.assertEqual(self.client.get(url).status_code, 422)
+        self.assertEqual(self.client.get(url + "&start=2020-01-01&end=2025-01-01").status_code, 400)
+        self.assertEqual(self.client.get(url + "&start=2025-02-01&end=2025-01-01").status_code, 400)
+        with patch.object(server.history_archiver, "query", return_value=[]) as mock_query:
+            response = self.client.get(url + "&start=2025-01-01&end=2025-02-01")
+        self.assertEqual(response.status_code, 200)
+        mock_query.assert_called_once_with(
+            email="jane.doe@example.com", start="2025-01-01T00:00:00", end="2025-02-01T00:00:00"
+        )
+
+    def test_basic_iso_dates_are_normalized(self):
+        self.db_manager.add_user("jane.doe@example.com", 175.0, 70.0, 30, "Regular exercise", "Female", [], "")
+        self.db_manager.add_history("jane.doe@example.com", "049000031652", 50, "", "", date="2025-01-15T10:00:00")
+        self.archiver.archive(now=datetime(2025, 6, 10))
+
+        response = self.client.get(
+            "/get_archived_history?email=jane.doe@example.com&start=20250101&end=20250201"
+        )
+        self.assertEqual([entry["upc"] for entry in response.json()], ["0049000031652"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import threading
+import time
+import unittest
+
+from upstream import BulkheadFull, CircuitOpen, DeadlineExceeded, Dependency, TokenBucket, request_deadline
+
+
+class NotFound(Exception):
+    pass
+
+
+class TestDependency(unittest.TestCase):
+    def test_slow_call_times_out(self):
+        dependency = Dependency("test_slow", timeout=0.05)
+        with self.assertRaises(DeadlineExceeded):
+            dependency.call(time.sleep, 0.5)
+        self.assertEqual(dependency.stats()["timeouts"], 1)
+
+    def test_request_deadline_caps_call_timeout(self):
+        dependency = Dependency("test_deadline", timeout=5)
+        started = time.monotonic()
+        with request_deadline(0.05):
+            self.assertEqual(dependency.call(time.sleep, 0.5, fallback="fallback"), "fallback")
+        self.assertLess(time.monotonic() - started, 0.4)
+
+    def test_hedged_call_returns_first_answer(self):
+        dependency = Dependency("test_hedge", timeout=2, hedge_after=0.05)
+        attempts = []
+        lock = threading.Lock()
+
+        def lookup():
+            with lock:
+                attempts.append(None)
+                first = len(attempts) == 1
+            time.sleep(1 if first else 0)
+            return "fast" if not first else "slow"
+
+        started = time.monotonic()
+        self.assertEqual(dependency.call(lookup, idempotent=True), "fast")
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(dependency.stats()["hedges"], 1)
+
+    def test_open_circuit_serves_cached_result(self):
+        dependency = Dependency("test_breaker", timeout=1, failure_threshold=2, reset_timeout=60)
+        self.assertEqual(dependency.call(lambda: "good", cache_key="upc"), "good")
+
+        def broken():
+            raise ConnectionError("down")
+
+        for _ in range(2):
+            self.assertEqual(dependency.call(broken, cache_key="upc"), "good")
+        self.assertEqual(dependency.breaker.state, "open")
+
+        calls = []
+        self.assertEqual(dependency.call(lambda: calls.append(None), cache_key="upc"), "good")
+        self.assertEqual(calls, [])
+        with self.assertRaises(CircuitOpen):
+            dependency.call(broken, cache_key="other")
+
+    def test_expected_errors_do_not_trip_breaker(self):
+        dependency = Dependency("test_expected", timeout=1, failure_threshold=1, expected_errors=(NotFound,))
+
+        def missing():
+            raise NotFound()
+
+        with self.assertRaises(NotFound):
+            dependency.call(missing)
+        self.assertEqual(dependency.breaker.state, "closed")
+
+    def test_shortened_calls_do_not_trip_breaker(self):
+        dependency = Dependency("test_short_budget", timeout=5, failure_threshold=1)
+        with request_deadline(0.05):
+            self.assertEqual(dependency.call(time.sleep, 0.5, fallback="fallback"), "fallback")
+        self.assertEqual(dependency.breaker.state, "closed")
+
+        dependency = Dependency("test_full_budget", timeout=0.05, failure_threshold=1)
+        dependency.call(time.sleep, 0.5, fallback="fallback")
+        self.assertEqual(dependency.breaker.state, "open")
+
+    def test_hedge_needs_rate_limit_token(self):
+        dependency = Dependency(
+            "test_hedge_limited", timeout=0.3, hedge_after=0.05, rate_limiter=TokenBucket(rate=0.1, burst=1)
+        )
+        self.assertEqual(dependency.call(time.sleep, 0.1, idempotent=True), None)
+        self.assertEqual(dependency.stats()["hedges"], 0)
+
+    def test_full_pool_rejects_calls(self):
+        dependency = Dependency("test_bulkhead", timeout=0.05, max_concurrent=1)
+        release = threading.Event()
+        # The abandoned call keeps its thread until it ends.
+        with self.assertRaises(DeadlineExceeded):
+            dependency.call(release.wait, 2)
+        with self.assertRaises(BulkheadFull):
+            dependency.call(lambda: "unreachable")
+        self.assertEqual(dependency.stats()["rejected"], 1)
+
+        release.set()
+        time.sleep(0.05)
+        self.assertEqual(dependency.call(lambda: "ok"), "ok")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,374 @@
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+from profiling import stage
+
+# Monotonic time by which the current request must finish, if any.
+_request_deadline = contextvars.ContextVar("request_deadline", default=None)
+
+# All dependencies by name, for metrics.
+_dependencies = {}
+
+_MISSING = object()
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request or call ran out of time."""
+
+
+class CircuitOpen(Exception):
+    """The dependency is failing and calls to it are being short-circuited."""
+
+
+class RateLimited(Exception):
+    """No rate limit token became available before the deadline."""
+
+
+class BulkheadFull(Exception):
+    """Every thread reserved for the dependency is busy with earlier calls."""
+
+
+@contextmanager
+def request_deadline(seconds: float):
+    """Bound every upstream call made inside the block to ``seconds`` in total."""
+    deadline = time.monotonic() + seconds
+    current = _request_deadline.get()
+    token = _request_deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _request_deadline.reset(token)
+
+
+def remaining_time():
+    """Return the seconds left before the request deadline, or None if unbounded."""
+    deadline = _request_deadline.get()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+class TokenBucket:
+    """
+    Allow ``rate`` calls per second on average, with bursts of up to
+    ``burst`` calls.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, timeout: float = 0.0) -> bool:
+        """Take a token, waiting up to ``timeout`` seconds for one to refill."""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait_for = (1 - self.tokens) / self.rate
+            if time.monotonic() + wait_for > deadline:
+                return False
+            time.sleep(wait_for)
+
+    @classmethod
+    def from_env(cls, prefix: str, default_per_minute: float = None):
+        """
+        Build a bucket from ``<prefix>_RATE_PER_MIN`` and ``<prefix>_BURST``.
+
+        Returns:
+            A TokenBucket, or None if no rate is configured.
+        """
+        per_minute = os.getenv(f"{prefix}_RATE_PER_MIN")
+        per_minute = float(per_minute) if per_minute else default_per_minute
+        if not per_minute:
+            return None
+        burst = int(os.getenv(f"{prefix}_BURST", max(1, int(per_minute / 10))))
+        return cls(per_minute / 60, burst)
+
+
+class CircuitBreaker:
+    """
+    Open after ``failure_threshold`` consecutive failures, then let a single
+    trial call through every ``reset_timeout`` seconds until one succeeds.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_ignored(self):
+        """End a call that neither succeeded nor counts as a failure."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class Dependency:
+    """
+    An upstream service called through a deadline, a circuit breaker and,
+    for idempotent calls, a hedged second attempt.
+
+    Calls run on threads of the dependency's own bounded pool, so callers
+    can stop waiting at their deadline and a slow dependency cannot take
+    threads from the others. Abandoned calls keep their thread until the
+    client's own timeout ends them; when every thread is busy, new calls
+    are rejected rather than queued.
+
+    Successful results can be remembered by ``cache_key`` and are served
+    when the dependency fails or its circuit is open.
+
+    Only timeouts of calls given the full ``timeout`` count towards opening
+    the circuit; a call cut short by the request deadline or a rate limit
+    wait is not evidence that the dependency is slow.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        timeout: float,
+        hedge_after: float = None,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        cache_size: int = 256,
+        expected_errors: tuple = (),
+        rate_limiter: TokenBucket = None,
+        max_concurrent: int = 16,
+    ):
+        """
+        Args:
+            name: Name used in metrics.
+            timeout: Maximum seconds to wait for a single call.
+            hedge_after: (Optional) Seconds after which an idempotent call is
+                sent a second time; the first answer wins.
+            failure_threshold: Consecutive failures that open the circuit.
+            reset_timeout: Seconds the circuit stays open before a trial call.
+            cache_size: Number of last-good results kept for fallback.
+            expected_errors: Exception types that are normal answers (e.g. not
+                found) rather than failures of the dependency.
+            rate_limiter: (Optional) Token bucket every call must take a
+                token from; calls wait for a token until their deadline.
+                Hedges also take a token, but never wait for one.
+            max_concurrent: Number of attempts, hedges included, that may
+                run at once.
+        """
+        self.name = name
+        self.timeout = timeout
+        self.hedge_after = hedge_after
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.cache_size = cache_size
+        self.expected_errors = expected_errors
+        self.rate_limiter = rate_limiter
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix=f"upstream-{name}")
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._cache = OrderedDict()
+        self._latencies = deque(maxlen=1000)
+        self._counts = {
+            "calls": 0,
+            "successes": 0,
+            "failures": 0,
+            "timeouts": 0,
+            "short_circuits": 0,
+            "hedges": 0,
+            "fallbacks": 0,
+            "rate_limited": 0,
+            "rejected": 0,
+        }
+        self._lock = threading.Lock()
+        _dependencies[name] = self
+
+    def _count(self, key: str):
+        with self._lock:
+            self._counts[key] += 1
+
+    def _remember(self, cache_key, result):
+        with self._lock:
+            self._cache[cache_key] = result
+            self._cache.move_to_end(cache_key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _fall_back(self, cache_key, fallback, error):
+        with self._lock:
+            if cache_key is not None and cache_key in self._cache:
+                self._counts["fallbacks"] += 1
+                return self._cache[cache_key]
+        if fallback is not _MISSING:
+            self._count("fallbacks")
+            return fallback
+        raise error
+
+    def _take_token(self) -> bool:
+        return self.rate_limiter is None or self.rate_limiter.acquire()
+
+    def _submit(self, fn, args, kwargs):
+        # The caller holds a slot, which is given back when the call ends,
+        # even if nobody is waiting for it any more.
+        future = self._executor.submit(fn, *args, **kwargs)
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _attempt(self, fn, args, kwargs, budget, idempotent):
+        futures = {self._submit(fn, args, kwargs)}
+        deadline = time.monotonic() + budget
+        hedge_at = time.monotonic() + self.hedge_after if idempotent and self.hedge_after else None
+        error = None
+
+        while True:
+            wake_at = min(deadline, hedge_at) if hedge_at else deadline
+            done, futures = wait(futures, timeout=max(0.0, wake_at - time.monotonic()), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+                if isinstance(error, self.expected_errors):
+                    raise error
+
+            now = time.monotonic()
+            if hedge_at and now < deadline and (now >= hedge_at or not futures):
+                # Send the hedge once: after hedge_after seconds, or straight
+                # away as a retry if the first attempt already failed. It is
+                # skipped if the pool is full or no rate limit token is free.
+                hedge_at = None
+                if self._slots.acquire(blocking=False):
+                    if self._take_token():
+                        self._count("hedges")
+                        futures.add(self._submit(fn, args, kwargs))
+                        continue
+                    self._slots.release()
+            if not futures:
+                raise error
+            elif now >= deadline:
+                raise DeadlineExceeded(f"{self.name} did not answer within {budget:.2f}s")
+
+    def call(self, fn, *args, idempotent: bool = False, cache_key=None, fallback=_MISSING, **kwargs):
+        """
+        Call ``fn(*args, **kwargs)`` under this dependency's policies.
+
+        Args:
+            fn: Function performing the upstream request.
+            idempotent: Whether the call may be hedged.
+            cache_key: (Optional) Key under which a successful result is
+                remembered and served when the dependency is unavailable.
+            fallback: (Optional) Value returned when the call fails and no
+                cached result exists. If not provided, the error is raised.
+
+        Returns:
+            The result of fn, a cached result, or the fallback.
+        """
+        self._count("calls")
+        budget = self.timeout
+        remaining = remaining_time()
+        if remaining is not None:
+            budget = min(budget, remaining)
+        if budget <= 0:
+            return self._fall_back(cache_key, fallback, DeadlineExceeded("Request deadline exceeded"))
+
+        if not self._take_token():
+            # Only a call that had to wait for its token loses time to it.
+            waited_from = time.monotonic()
+            if not self.rate_limiter.acquire(timeout=budget):
+                self._count("rate_limited")
+                return self._fall_back(cache_key, fallback, RateLimited(f"{self.name} rate limit reached"))
+            budget -= time.monotonic() - waited_from
+
+        if not self._slots.acquire(blocking=False):
+            self._count("rejected")
+            return self._fall_back(cache_key, fallback, BulkheadFull(f"{self.name} has no free threads"))
+
+        if not self.breaker.allow():
+            self._slots.release()
+            self._count("short_circuits")
+            return self._fall_back(cache_key, fallback, CircuitOpen(f"{self.name} circuit is open"))
+
+        started = time.monotonic()
+        try:
+            # Shows up as a stage of the request in its profile.
+            with stage(self.name):
+                result = self._attempt(fn, args, kwargs, budget, idempotent)
+        except self.expected_errors:
+            self.breaker.record_success()
+            self._count("successes")
+            raise
+        except Exception as e:
+            if isinstance(e, DeadlineExceeded) and budget < self.timeout:
+                # Cut short by the request deadline or a rate limit wait;
+                # says nothing about the dependency itself.
+                self.breaker.record_ignored()
+            else:
+                self.breaker.record_failure()
+            self._count("timeouts" if isinstance(e, TimeoutError) else "failures")
+            print(f"ERROR calling {self.name}: {e!r}")
+            return self._fall_back(cache_key, fallback, e)
+        finally:
+            with self._lock:
+                self._latencies.append(time.monotonic() - started)
+
+        self.breaker.record_success()
+        self._count("successes")
+        if cache_key is not None:
+            self._remember(cache_key, result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            counts = dict(self._counts)
+        stats = {"state": self.breaker.state, **counts}
+        if latencies:
+            stats["p50_ms"] = round(latencies[len(latencies) // 2] * 1000, 1)
+            stats["p95_ms"] = round(latencies[int(len(latencies) * 0.95) - 1 if len(latencies) > 1 else 0] * 1000, 1)
+        return stats
+
+
+def metrics():
+    """Return the stats of every dependency, by name."""
+    return {name: dependency.stats() for name, dependency in _dependencies.items()}